@@ -21,6 +21,8 @@ st.markdown("""## Tasks""")
 
 st.page_link("pages/1_💬_Text_Generation.py", label="Text Generation", icon="💬")
 st.page_link("pages/2_🎨_Text_to_Image.py", label="Text to Image", icon="🎨")
+if config.diagnostics:
+    st.page_link("pages/3_📊_Diagnostics.py", label="Diagnostics", icon="📊")
 
 st.markdown("""
 ## Providers
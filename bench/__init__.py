@@ -0,0 +1,13 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Keep benchmark runs out of the app's caches and metrics log. Set on import of the package, so before any
+# bench module imports `lib` (whose config reads them). The first bench process creates the directory and
+# removes it on exit; the mock server and app processes it starts inherit it through the environment.
+if "PLAYGROUND_BENCH_DIR" not in os.environ:
+    os.environ["PLAYGROUND_BENCH_DIR"] = tempfile.mkdtemp(prefix="playground-bench-")
+    atexit.register(shutil.rmtree, os.environ["PLAYGROUND_BENCH_DIR"], ignore_errors=True)
+os.environ["PLAYGROUND_CACHE_DIR"] = os.environ["PLAYGROUND_BENCH_DIR"]
+os.environ.pop("PLAYGROUND_METRICS_LOG", None)
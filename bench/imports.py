@@ -0,0 +1,89 @@
+"""Measure what importing the app costs: per page, on the first request to a provider, and all at once.
+
+    python -m bench.imports
+    python -m bench.imports --runs 20
+
+Each scenario runs in a fresh interpreter with Streamlit already imported, like a page script on the
+server, and times only the app's own imports. Reports median wall time, the memory they add (read from
+/proc, so Linux only), and how many modules they load. "everything" imports every name in `lib` plus both
+provider SDKs, which is what each page paid when `lib` imported all of its submodules up front.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from statistics import median
+
+from .run import ROOT
+
+# name -> (statement to time, setup run before the timer starts)
+SCENARIOS = {
+    "home": ("from lib import config", ""),
+    "text page": ("from lib import config, fit_context, txt2txt_generate", ""),
+    "image page": (
+        "from lib import config, session_jobs, submit_job, target_image_size, txt2img_hedged_async",
+        "",
+    ),
+    "first anthropic request": (
+        "asyncio.run(get_sdk_client('anthropic', 'key', None))",
+        "import asyncio; from lib import txt2txt_generate; from lib.clients import get_sdk_client",
+    ),
+    "first openai request": (
+        "asyncio.run(get_sdk_client('openai', 'key', 'https://api.openai.com/v1'))",
+        "import asyncio; from lib import txt2txt_generate; from lib.clients import get_sdk_client",
+    ),
+    "everything": ("import lib, anthropic, openai; [getattr(lib, name) for name in lib.__all__]", ""),
+}
+
+PROBE = """
+import json, os, sys, time
+import streamlit
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+{setup}
+modules = len(sys.modules)
+memory = rss()
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "memory": rss() - memory,
+    "modules": len(sys.modules) - modules,
+}}))
+"""
+
+
+def measure(statement, setup) -> dict:
+    code = PROBE.format(statement=statement, setup=setup)
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), help="Scenarios to run")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per scenario")
+    args = parser.parse_args()
+
+    header = f"{'scenario':<26}{'median ms':>10}{'min ms':>8}{'KiB':>8}{'modules':>9}"
+    print(header)
+    print("-" * len(header))
+    for name in args.only or SCENARIOS:
+        results = [measure(*SCENARIOS[name]) for _ in range(args.runs)]
+        seconds = [r["seconds"] for r in results]
+        print(
+            f"{name:<26}{median(seconds) * 1000:>10.0f}{min(seconds) * 1000:>8.0f}"
+            f"{median(r['memory'] for r in results):>8.0f}{results[-1]['modules']:>9}",
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
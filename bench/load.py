@@ -0,0 +1,264 @@
+"""Load test both pages with concurrent simulated sessions against the mock providers.
+
+    python -m bench.load                                 # 1, 2, 4, ... 32 sessions
+    python -m bench.load --sessions 1 8 64 --turns 5 --latency 0.5 --token-rate 50
+
+Starts the app on a real Streamlit server (pointed at the mock providers) and connects headless websocket
+clients that speak Streamlit's protocol, so every session gets its own script thread like a browser tab
+would. Each session opens a page and sends `--turns` prompts. Reports script-run latency, throughput, server
+memory per session, and the session count where throughput stops scaling.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from statistics import quantiles
+from typing import List, Optional
+
+import httpx
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import websocket_connect
+
+from .mock_providers import MockSettings, patch_config
+from .run import ROOT, config, start_server
+
+# URL path names Streamlit gives the pages
+PAGES = {
+    "text": "Text_Generation",
+    "image": "Text_to_Image",
+}
+
+# Throughput gained from adding sessions below this fraction means the server is saturated
+SCALING_THRESHOLD = 0.1
+
+
+@dataclass
+class LoadResult:
+    page: str
+    sessions: int
+    runs: int
+    errors: int
+    run_p50: float
+    run_p95: float
+    throughput: float
+    rss_per_session: Optional[int]
+
+
+def rss(pid) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+# One simulated browser tab: open the page, then send prompts one after another
+class Session:
+    def __init__(self, url, page, timeout):
+        self.url = url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.page = page
+        self.timeout = timeout
+        self.chat_input_id = None
+        self.durations = []
+        self.errors = 0
+
+    # Send a rerun (of the whole page, or of one fragment) and wait until the script has finished, following
+    # `st.rerun()` calls. Returns the (interval, fragment ID) the page wants polled after a full run, like a
+    # fragment with `run_every` showing unfinished jobs.
+    async def rerun(self, ws, prompt=None, poll=None):
+        message = BackMsg()
+        message.rerun_script.page_name = PAGES[self.page]
+        if prompt is not None:
+            widget = message.rerun_script.widget_states.widgets.add()
+            widget.id = self.chat_input_id
+            widget.string_trigger_value.data = prompt
+        if poll is not None:
+            message.rerun_script.fragment_id = poll[1]
+            message.rerun_script.is_auto_rerun = True
+
+        await ws.write_message(message.SerializeToString(), binary=True)
+        while True:
+            data = await asyncio.wait_for(ws.read_message(), self.timeout)
+            if data is None:
+                raise ConnectionError("Server closed the connection")
+
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                if element.WhichOneof("type") == "chat_input":
+                    self.chat_input_id = element.chat_input.id
+                elif element.WhichOneof("type") == "exception":
+                    self.errors += 1
+            elif kind == "auto_rerun":
+                poll = (forward.auto_rerun.interval, forward.auto_rerun.fragment_id)
+            elif kind == "script_finished":
+                if forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+                # The fragment asked for the whole page to rerun, which registers its own polling
+                poll = None
+        return poll
+
+    # One turn lasts until its result is on the page: the script run, then any polling for a background job
+    async def turn(self, ws, prompt=None):
+        start = time.perf_counter()
+        poll = await self.rerun(ws, prompt)
+        while poll is not None:
+            await asyncio.sleep(poll[0])
+            poll = await self.rerun(ws, poll=poll)
+        self.durations.append(time.perf_counter() - start)
+
+    async def run(self, turns):
+        ws = await websocket_connect(HTTPRequest(self.url), max_message_size=1 << 30)
+        try:
+            await self.turn(ws)
+            for turn in range(turns):
+                if self.chat_input_id is None:
+                    raise RuntimeError("No chat input on the page")
+                await self.turn(ws, f"Load test prompt {turn}")
+        except Exception:
+            # Timeouts and disconnects; the session stops here like a user giving up
+            self.errors += 1
+        finally:
+            ws.close()
+
+
+async def load(url, pid, page, sessions, turns, timeout) -> LoadResult:
+    before = rss(pid)
+    clients = [Session(url, page, timeout) for _ in range(sessions)]
+    start = time.perf_counter()
+    await asyncio.gather(*[client.run(turns) for client in clients])
+    elapsed = time.perf_counter() - start
+    after = rss(pid)
+
+    durations = [d for client in clients for d in client.durations]
+    cuts = (
+        quantiles(durations, n=100, method="inclusive") if len(durations) > 1 else (durations or [0.0]) * 99
+    )
+    return LoadResult(
+        page=page,
+        sessions=sessions,
+        runs=len(durations),
+        errors=sum(client.errors for client in clients),
+        run_p50=cuts[49],
+        run_p95=cuts[94],
+        throughput=len(durations) / elapsed,
+        rss_per_session=None if before is None or after is None else max(after - before, 0) // sessions,
+    )
+
+
+def saturation(results: List[LoadResult]):
+    for previous, current in zip(results, results[1:], strict=False):
+        if current.throughput < previous.throughput * (1 + SCALING_THRESHOLD):
+            return previous.sessions
+    return None
+
+
+# Run the app in this process with every provider pointed at the mock server
+def serve(mock_url, port):
+    from streamlit.web import bootstrap
+
+    os.chdir(ROOT)
+    patch_config(config, mock_url)
+    os.environ["ANTHROPIC_BASE_URL"] = f"{mock_url}/anthropic"
+    flag_options = {
+        "server.address": "127.0.0.1",
+        "server.port": port,
+        "server.headless": True,
+        "server.fileWatcherType": "none",
+        "server.runOnSave": False,
+        "browser.gatherUsageStats": False,
+    }
+    bootstrap.load_config_options(flag_options)
+    bootstrap.run(str(ROOT / "0_🏠_Home.py"), False, [], flag_options)
+
+
+def start_app(mock_url, port):
+    command = [sys.executable, "-m", "bench.load", "--serve", mock_url, "--port", str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if httpx.get(f"{url}/_stcore/health").status_code == 200:
+                return process, url
+        except httpx.TransportError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("App did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", nargs="+", default=list(PAGES), choices=list(PAGES))
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock time to first byte (seconds)")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="Mock tokens per second")
+    parser.add_argument("--tokens", type=int, default=64, help="Mock tokens per completion")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Script run timeout (seconds)")
+    parser.add_argument("--port", type=int, default=8599, help="App port")
+    parser.add_argument("--serve", metavar="MOCK_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    mock, mock_url = start_server()
+    app = None
+    try:
+        settings = {
+            **asdict(MockSettings()),
+            "latency": args.latency,
+            "token_rate": args.token_rate,
+            "tokens": args.tokens,
+            "image_size": 512,
+            "image_bytes": 512 << 10,
+            "poll_latency": 1.0,
+        }
+        httpx.post(f"{mock_url}/_settings", json=settings).raise_for_status()
+        app, url = start_app(mock_url, args.port)
+
+        header = (
+            f"{'page':<7}{'sessions':>9}{'runs':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'runs/s':>8}"
+            f"{'RSS KiB/session':>17}"
+        )
+        for page in args.pages:
+            print(header)
+            print("-" * len(header))
+            # Warm up so imports and first-run allocations aren't counted against the first level
+            asyncio.run(load(url, app.pid, page, 1, 1, args.timeout))
+            results = []
+            for sessions in sorted(args.sessions):
+                r = asyncio.run(load(url, app.pid, page, sessions, args.turns, args.timeout))
+                results.append(r)
+                memory = "-" if r.rss_per_session is None else f"{r.rss_per_session / 1024:.0f}"
+                print(
+                    f"{r.page:<7}{r.sessions:>9}{r.runs:>7}{r.errors:>7}{r.run_p50 * 1000:>9.0f}"
+                    f"{r.run_p95 * 1000:>9.0f}{r.throughput:>8.1f}{memory:>17}",
+                    flush=True,
+                )
+
+            knee = saturation(results)
+            if knee:
+                print(f"Throughput stops scaling after {knee} sessions\n")
+            else:
+                print(f"Throughput still scaling at {results[-1].sessions} sessions\n")
+    finally:
+        for process in [app, mock]:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Local stand-ins for every provider API, for benchmarking without keys or network.
+
+    python -m bench.mock_providers --port 8000 --latency 0.2 --token-rate 50
+
+Speaks OpenAI-compatible SSE (OpenAI, Hugging Face text, Perplexity), Anthropic SSE events, BFL submit and
+`get_result` polling, fal (sync-mode data URLs or CDN URLs), together (URL responses) and Hugging Face (raw
+image bytes). Settings can be changed while running with `POST /_settings` and a JSON body.
+"""
+
+import argparse
+import base64
+import json
+import os
+import struct
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from itertools import count
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from lib.catalog import read_catalog
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+
+
+@dataclass
+class MockSettings:
+    latency: float = 0.0  # seconds before the first byte of every response
+    token_rate: float = 0.0  # streamed tokens per second, 0 for as fast as possible
+    tokens: int = 128  # tokens per text completion
+    image_size: int = 1024  # width and height of generated images
+    image_bytes: int = 1 << 20  # images are padded up to this size
+    poll_latency: float = 1.0  # seconds until a BFL result is ready
+    chunk_size: int = 64 << 10  # bytes per write for image and JSON bodies
+
+
+# A real PNG of the requested dimensions, padded with a private ancillary chunk so the payload size can be
+# set independently of the pixels
+def make_png(size: int, total_bytes: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), (96, 128, 160)).save(buffer, format="PNG")
+    png = buffer.getvalue()
+
+    padding = total_bytes - len(png) - 12
+    if padding <= 0:
+        return png
+
+    data = b"\0" * padding
+    chunk = struct.pack(">I", len(data)) + b"bnCh" + data
+    chunk += struct.pack(">I", zlib.crc32(b"bnCh" + data) & 0xFFFFFFFF)
+    iend = png.rindex(b"IEND") - 4
+    return png[:iend] + chunk + png[iend:]
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings: MockSettings):
+        super().__init__(address, MockHandler)
+        self.ids = count(1)
+        self.jobs = {}
+        self.lock = Lock()
+        self.requests = 0
+        self.update(**asdict(settings))
+
+    def update(self, **settings):
+        with self.lock:
+            current = asdict(getattr(self, "settings", MockSettings()))
+            self.settings = MockSettings(**{**current, **settings})
+            self.image = make_png(self.settings.image_size, self.settings.image_bytes)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("content-length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def start(self, content_type, length=None):
+        time.sleep(self.server.settings.latency)
+        self.send_response(200)
+        self.send_header("content-type", content_type)
+        if length is None:
+            self.send_header("transfer-encoding", "chunked")
+        else:
+            self.send_header("content-length", str(length))
+        self.end_headers()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def end_chunks(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def send_body(self, content_type, body: bytes):
+        self.start(content_type, len(body))
+        size = self.server.settings.chunk_size
+        for i in range(0, len(body), size):
+            self.wfile.write(body[i : i + size])
+        self.wfile.flush()
+
+    def send_json(self, data):
+        self.send_body("application/json", json.dumps(data).encode("utf-8"))
+
+    def send_error_json(self, status, message):
+        body = json.dumps({"error": {"message": message}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_tokens(self):
+        settings = self.server.settings
+        for i in range(settings.tokens):
+            if settings.token_rate and i:
+                time.sleep(1 / settings.token_rate)
+            yield ("" if i == 0 else " ") + WORDS[i % len(WORDS)]
+
+    def image_url(self):
+        return f"{self.server.url}/images/{next(self.server.ids)}.png"
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+        path = urlparse(self.path).path
+        body = self.read_json()
+
+        if path == "/_settings":
+            self.server.update(**body)
+            return self.send_json(asdict(self.server.settings))
+
+        if path.endswith("/chat/completions"):
+            return self.openai(body)
+        if path.startswith("/anthropic/") and path.endswith("/messages"):
+            return self.anthropic(body)
+        if path.startswith("/bfl/"):
+            return self.bfl_submit()
+        if path.startswith("/fal/"):
+            return self.fal(body)
+        if path.startswith("/hf/"):
+            return self.send_body("image/png", self.server.image)
+        if path.startswith("/together"):
+            return self.send_json({"data": [{"url": self.image_url()}]})
+        return self.send_error_json(404, f"Unknown endpoint {path}")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/bfl/get_result"):
+            return self.bfl_result(parse_qs(url.query).get("id", [""])[0])
+        if url.path.startswith("/images/"):
+            return self.send_body("image/png", self.server.image)
+        if url.path == "/_settings":
+            return self.send_json({**asdict(self.server.settings), "requests": self.server.requests})
+        return self.send_error_json(404, f"Unknown endpoint {url.path}")
+
+    # https://platform.openai.com/docs/api-reference/chat/streaming
+    def openai(self, body):
+        self.start("text/event-stream")
+        for text in self.stream_tokens():
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.end_chunks()
+
+    # https://docs.anthropic.com/en/api/messages-streaming
+    def anthropic(self, body):
+        def event(type, data):
+            self.write_chunk(f"event: {type}\ndata: {json.dumps({'type': type, **data})}\n\n".encode("utf-8"))
+
+        self.start("text/event-stream")
+        message = {
+            "id": "msg_mock",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": 1},
+        }
+        event("message_start", {"message": message})
+        event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for text in self.stream_tokens():
+            event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text}})
+        event("content_block_stop", {"index": 0})
+        event(
+            "message_delta",
+            {
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": self.server.settings.tokens},
+            },
+        )
+        event("message_stop", {})
+        self.end_chunks()
+
+    # https://api.bfl.ml/docs
+    def bfl_submit(self):
+        id = str(next(self.server.ids))
+        with self.server.lock:
+            self.server.jobs[id] = time.monotonic() + self.server.settings.poll_latency
+        self.send_json({"id": id})
+
+    def bfl_result(self, id):
+        with self.server.lock:
+            ready_at = self.server.jobs.get(id)
+        if ready_at is None:
+            return self.send_json({"id": id, "status": "Task not found"})
+        if time.monotonic() < ready_at:
+            return self.send_json({"id": id, "status": "Pending"})
+        self.send_json({"id": id, "status": "Ready", "result": {"sample": self.image_url()}})
+
+    # https://fal.ai/models/fal-ai/flux/dev/api
+    def fal(self, body):
+        if body.get("sync_mode"):
+            url = "data:image/png;base64," + base64.b64encode(self.server.image).decode("ascii")
+        else:
+            url = self.image_url()
+        self.send_json({"images": [{"url": url, "content_type": "image/png"}], "seed": body.get("seed", 0)})
+
+
+# The catalog's provider, model and preset rate limits, which would make a benchmark measure the limiter's
+# waits instead of the client
+def _drop_rate_limits(table: dict):
+    table.pop("rate_limit", None)
+    for value in table.values():
+        if isinstance(value, dict):
+            _drop_rate_limits(value)
+
+
+# Point every provider in the catalog at the mock server: a copy of the catalog file with the mock's URLs and
+# without its rate limits becomes the one `config` loads, and API keys are set to "mock" through their
+# environment variables
+def patch_config(config, url: str):
+    paths = {
+        "anthropic": "/anthropic/v1",
+        "bfl": "/bfl",
+        "fal": "/fal",
+        "hf": "/hf",
+        "openai": "/openai/v1",
+        "pplx": "/pplx",
+        "together": "/together",
+    }
+    data = read_catalog(config.catalog.path)
+    _drop_rate_limits(data)
+    for provider, path in paths.items():
+        table = data.get("providers", {}).get(provider)
+        if table is not None:
+            table["url"] = f"{url}{path}"
+            # The mock doesn't list models, and the real listings would hide nothing it serves
+            table.pop("discovery", None)
+            if table.get("api_key_env"):
+                os.environ[table["api_key_env"]] = "mock"
+
+    with NamedTemporaryFile("w", prefix="catalog-", suffix=".json", delete=False) as f:
+        json.dump(data, f)
+    config.catalog.path = f.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    for name, value in asdict(MockSettings()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    settings = MockSettings(**{name: getattr(args, name) for name in asdict(MockSettings())})
+    server = MockServer((args.host, args.port), settings)
+    # The first line is the address, so a parent process started with port 0 can find it
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Benchmark every lib.api code path against the mock providers.
+
+    python -m bench.run                                  # all scenarios
+    python -m bench.run --only image --iterations 50
+    python -m bench.run --save baseline.json             # record a baseline
+    python -m bench.run --baseline baseline.json         # exit 1 on regressions
+
+Reports latency percentiles, throughput, client CPU time per operation and peak Python memory. The mock
+server runs in its own process so its work isn't counted.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from statistics import quantiles
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from lib import (
+    config,
+    get_catalog,
+    txt2img_batch_async,
+    txt2img_generate_async,
+    txt2txt_stream_async,
+)
+from lib.image import StoredImage
+from lib.loop import run
+
+from .mock_providers import MockSettings, patch_config
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Results that got worse by more than this fraction of the baseline are regressions
+THRESHOLD = 0.2
+COMPARED = ["latency_p50", "latency_p95", "cpu_per_op", "peak_memory"]
+
+
+@dataclass
+class Scenario:
+    name: str
+    operation: Callable
+    settings: Dict = field(default_factory=dict)
+
+
+@dataclass
+class Result:
+    name: str
+    iterations: int
+    concurrency: int
+    latency_p50: float
+    latency_p95: float
+    throughput: float
+    cpu_per_op: float
+    peak_memory: int
+
+
+def first_model(provider, kind):
+    return next(iter(getattr(get_catalog().providers[provider], kind)))
+
+
+def text(provider):
+    async def operation():
+        parameters = {
+            "model": first_model(provider, "text"),
+            "max_tokens": 512,
+            "messages": [{"role": "user", "content": "Benchmark"}],
+        }
+        if provider == "anthropic":
+            parameters["system"] = "You are a benchmark."
+        text = ""
+        async for chunk in txt2txt_stream_async("mock", provider, parameters):
+            text += chunk
+        if not text:
+            raise RuntimeError(f"{provider}: empty completion")
+
+    return operation
+
+
+def image(provider, **parameters):
+    async def operation():
+        result = await txt2img_generate_async(
+            "mock", provider, first_model(provider, "image"), "Benchmark", parameters
+        )
+        if not isinstance(result, StoredImage):
+            raise RuntimeError(f"{provider}: {result}")
+
+    return operation
+
+
+def batch(provider, size, concurrency, **parameters):
+    async def operation():
+        variations = [{**parameters, "seed": i} for i in range(size)]
+        async for _, result in txt2img_batch_async(
+            "mock", provider, first_model(provider, "image"), "Benchmark", variations, concurrency
+        ):
+            if not isinstance(result, StoredImage):
+                raise RuntimeError(f"{provider}: {result}")
+
+    return operation
+
+
+SCENARIOS = [
+    Scenario("text/openai", text("openai"), {"tokens": 256}),
+    Scenario("text/hf", text("hf"), {"tokens": 256}),
+    Scenario("text/anthropic", text("anthropic"), {"tokens": 256}),
+    Scenario("image/hf", image("hf"), {"image_bytes": 2 << 20}),
+    Scenario("image/fal-sync", image("fal", sync_mode=True), {"image_bytes": 2 << 20}),
+    Scenario("image/fal-url", image("fal", sync_mode=False), {"image_bytes": 2 << 20}),
+    Scenario("image/together", image("together"), {"image_bytes": 2 << 20}),
+    Scenario("image/bfl", image("bfl"), {"image_bytes": 2 << 20, "poll_latency": 0.5}),
+    Scenario(
+        "batch/fal-url", batch("fal", 8, 4, sync_mode=False), {"image_bytes": 1 << 20, "image_size": 512}
+    ),
+]
+
+
+async def measure(operation, iterations, concurrency) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await operation()
+            return time.perf_counter() - start
+
+    return list(await asyncio.gather(*[timed() for _ in range(iterations)]))
+
+
+def benchmark(scenario: Scenario, iterations, concurrency, warmup=2) -> Result:
+    run(measure(scenario.operation, warmup, 1))
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    latencies = run(measure(scenario.operation, iterations, concurrency))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    # Memory is traced in a separate pass because tracing slows everything down
+    tracemalloc.start()
+    try:
+        run(measure(scenario.operation, concurrency, concurrency))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    cuts = quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return Result(
+        name=scenario.name,
+        iterations=iterations,
+        concurrency=concurrency,
+        latency_p50=cuts[49],
+        latency_p95=cuts[94],
+        throughput=iterations / elapsed,
+        cpu_per_op=cpu / iterations,
+        peak_memory=peak,
+    )
+
+
+def start_server():
+    command = [sys.executable, "-m", "bench.mock_providers"]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("Mock server did not start")
+    return process, url
+
+
+def print_results(results: List[Result], baseline: Optional[Dict[str, dict]] = None):
+    header = f"{'scenario':<18}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}{'cpu ms/op':>11}{'peak MiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        line = (
+            f"{r.name:<18}{r.latency_p50 * 1000:>10.1f}{r.latency_p95 * 1000:>10.1f}{r.throughput:>10.1f}"
+            f"{r.cpu_per_op * 1000:>11.2f}{r.peak_memory / (1 << 20):>10.2f}"
+        )
+        if baseline and r.name in baseline:
+            changes = [
+                f"{key} {getattr(r, key) / baseline[r.name][key] - 1:+.0%}"
+                for key in COMPARED
+                if baseline[r.name][key]
+            ]
+            line += "  " + ", ".join(changes)
+        print(line)
+
+
+def regressions(results: List[Result], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    found = []
+    for r in results:
+        for key in COMPARED:
+            before = baseline.get(r.name, {}).get(key)
+            if before and getattr(r, key) > before * (1 + threshold):
+                found.append(f"{r.name} {key}: {before:.6g} -> {getattr(r, key):.6g}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="", help="Run scenarios whose name contains this")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock time to first byte (seconds)")
+    parser.add_argument(
+        "--token-rate", type=float, default=0.0, help="Mock tokens per second (0 = unlimited)"
+    )
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved by --save")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    process, url = start_server()
+    try:
+        patch_config(config, url)
+        # The Anthropic client isn't given a base URL, so point it at the mock through the environment
+        os.environ["ANTHROPIC_BASE_URL"] = f"{url}/anthropic"
+
+        results = []
+        for scenario in SCENARIOS:
+            if args.only not in scenario.name:
+                continue
+            settings = {**asdict(MockSettings()), "latency": args.latency, "token_rate": args.token_rate}
+            httpx.post(f"{url}/_settings", json={**settings, **scenario.settings}).raise_for_status()
+            results.append(benchmark(scenario, args.iterations, args.concurrency))
+    finally:
+        process.terminate()
+        process.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r["name"]: r for r in json.load(f)}
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    if baseline:
+        found = regressions(results, baseline, args.threshold)
+        if found:
+            print(f"\nRegressions over {args.threshold:.0%}:")
+            print("\n".join(f"  {line}" for line in found))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
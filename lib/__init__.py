@@ -1,11 +1,159 @@
-from .api import txt2img_generate, txt2txt_generate
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+# Imported up front because it shares its name with its module: importing any other submodule would
+# otherwise leave `lib.config` pointing at the module instead of the settings. It only needs the stdlib.
 from .config import config
-from .util import base64_decode_image_data_url, base64_encode_image_file
 
+# Public names are imported from their submodule on first access (PEP 562), so a page only pays for what it
+# uses: `from lib import config` doesn't load Streamlit, PIL, httpx, or the provider SDKs.
+_submodules = {
+    "api": [
+        "txt2img_batch",
+        "txt2img_batch_async",
+        "txt2img_failover",
+        "txt2img_failover_async",
+        "txt2img_generate",
+        "txt2img_generate_async",
+        "txt2img_hedged",
+        "txt2img_hedged_async",
+        "txt2txt_failover_stream_async",
+        "txt2txt_generate",
+        "txt2txt_hedged_stream_async",
+        "txt2txt_stream_async",
+    ],
+    "cache": ["image_cache", "text_cache"],
+    "catalog": ["Catalog", "catalog_status", "get_catalog"],
+    "context": ["ContextReport", "estimate_tokens", "fit_context"],
+    "discovery": ["listings", "model_available", "visible_models", "visible_providers"],
+    "image": ["StoredImage", "enforce_image_budget"],
+    "jobs": [
+        "BATCH",
+        "INTERACTIVE",
+        "cancel_job",
+        "job_position",
+        "job_stats",
+        "pop_job",
+        "session_id",
+        "session_jobs",
+        "submit_job",
+    ],
+    "limiter": ["limiters", "queue_message"],
+    "metrics": ["metrics_store"],
+    "retry": ["breakers"],
+    "util": [
+        "Base64DataURLDecoder",
+        "base64_decode_data_url",
+        "base64_decode_image_data_url",
+        "base64_encode_image_file",
+        "target_image_size",
+    ],
+}
+_exports = {name: module for module, names in _submodules.items() for name in names}
+
+# `__all__` stays a literal for static tools. tests/test_lib.py checks it against `_submodules`, and ruff's
+# F822 reports any name missing from the `TYPE_CHECKING` block below.
 __all__ = [
+    "BATCH",
+    "INTERACTIVE",
+    "Base64DataURLDecoder",
+    "Catalog",
+    "ContextReport",
+    "StoredImage",
+    "base64_decode_data_url",
     "base64_decode_image_data_url",
     "base64_encode_image_file",
+    "breakers",
+    "cancel_job",
+    "catalog_status",
     "config",
+    "enforce_image_budget",
+    "estimate_tokens",
+    "fit_context",
+    "get_catalog",
+    "image_cache",
+    "job_position",
+    "job_stats",
+    "limiters",
+    "listings",
+    "metrics_store",
+    "model_available",
+    "pop_job",
+    "queue_message",
+    "session_id",
+    "session_jobs",
+    "submit_job",
+    "target_image_size",
+    "text_cache",
+    "txt2img_batch",
+    "txt2img_batch_async",
+    "txt2img_failover",
+    "txt2img_failover_async",
     "txt2img_generate",
+    "txt2img_generate_async",
+    "txt2img_hedged",
+    "txt2img_hedged_async",
+    "txt2txt_failover_stream_async",
     "txt2txt_generate",
+    "txt2txt_hedged_stream_async",
+    "txt2txt_stream_async",
+    "visible_models",
+    "visible_providers",
 ]
+
+
+def __getattr__(name):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_exports})
+
+
+# For type checkers and editors, which don't run `__getattr__`
+if TYPE_CHECKING:
+    from .api import (
+        txt2img_batch,
+        txt2img_batch_async,
+        txt2img_failover,
+        txt2img_failover_async,
+        txt2img_generate,
+        txt2img_generate_async,
+        txt2img_hedged,
+        txt2img_hedged_async,
+        txt2txt_failover_stream_async,
+        txt2txt_generate,
+        txt2txt_hedged_stream_async,
+        txt2txt_stream_async,
+    )
+    from .cache import image_cache, text_cache
+    from .catalog import Catalog, catalog_status, get_catalog
+    from .context import ContextReport, estimate_tokens, fit_context
+    from .discovery import listings, model_available, visible_models, visible_providers
+    from .image import StoredImage, enforce_image_budget
+    from .jobs import (
+        BATCH,
+        INTERACTIVE,
+        cancel_job,
+        job_position,
+        job_stats,
+        pop_job,
+        session_id,
+        session_jobs,
+        submit_job,
+    )
+    from .limiter import limiters, queue_message
+    from .metrics import metrics_store
+    from .retry import breakers
+    from .util import (
+        Base64DataURLDecoder,
+        base64_decode_data_url,
+        base64_decode_image_data_url,
+        base64_encode_image_file,
+        target_image_size,
+    )
@@ -1,45 +1,296 @@
-import time
+import asyncio
+from contextlib import aclosing, contextmanager
 from io import BytesIO
+from json import loads
 
-import httpx
 import streamlit as st
-from anthropic import Anthropic
-from anthropic import APIError as AnthropicAPIError
-from openai import APIError as OpenAIAPIError
-from openai import OpenAI
-from PIL import Image
 
-from .config import config
-from .util import base64_decode_image_data_url
+from .cache import cache_key, image_cache, text_cache
+from .catalog import get_catalog
+from .clients import get_http_client, get_sdk_client, loaded_errors
+from .config import POLL_INTERVAL_RANGE, config
+from .context import estimate_message_tokens, estimate_tokens
+from .hedge import (
+    hedge_backends,
+    hedge_delay,
+    race,
+    record_latency,
+    translate_image_parameters,
+    translate_text_parameters,
+)
+from .image import IMAGE_HEADER_BYTES, StoredImage, image_format
+from .limiter import QueueStatus, admitted, queue_message
+from .loop import iterate, run
+from .metrics import instrument
+from .poller import get_poller
+from .retry import ProviderError, fallback_backend, retry_stream, should_fail_over, with_retries
+from .util import Base64DataURLDecoder
 
 
-def txt2txt_generate(api_key, provider, parameters, **kwargs):
+# Mark the system prompt and the stable prefix of the conversation as cacheable.
+# The breakpoint on the newest user message writes the whole prefix to the cache for the next turn, and the
+# one on the previous user message reads what the last turn wrote. Prefixes shorter than the model's minimum
+# (1024 or 2048 tokens) are simply not cached.
+# https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+def with_cache_control(parameters):
+    cache_control = {"type": "ephemeral"}
+    parameters = {**parameters}
+
+    if isinstance(parameters.get("system"), str) and parameters["system"]:
+        parameters["system"] = [
+            {"type": "text", "text": parameters["system"], "cache_control": cache_control}
+        ]
+
+    messages = [{**m} for m in parameters.get("messages", [])]
+    user_indexes = [i for i, m in enumerate(messages) if m["role"] == "user"]
+    for i in user_indexes[-2:]:
+        if isinstance(messages[i]["content"], str):
+            messages[i]["content"] = [
+                {"type": "text", "text": messages[i]["content"], "cache_control": cache_control}
+            ]
+    parameters["messages"] = messages
+    return parameters
+
+
+async def _replay(lines):
+    for line in lines:
+        yield line
+
+
+# Tokens a text request counts against the model's tokens-per-minute limit: its prompt and completion
+def request_tokens(parameters):
+    messages = parameters.get("messages", [])
+    prompt = estimate_tokens(parameters.get("system")) + sum(estimate_message_tokens(m) for m in messages)
+    return prompt + (parameters.get("max_tokens") or 0)
+
+
+# While the script waits, show where the request is in the provider's queue (if it has to wait at all)
+@contextmanager
+def queue_caption(queue):
+    placeholder = st.empty()
+    shown = None
+
+    def update():
+        nonlocal shown
+        text = queue_message(queue)
+        if text != shown:
+            if text:
+                placeholder.caption(text)
+            else:
+                placeholder.empty()
+            shown = text
+
+    yield update
+    placeholder.empty()
+
+
+async def txt2txt_stream_async(api_key, provider, parameters, cache=False, usage=None, queue=None, **kwargs):
     model = parameters.get("model", "")
-    base_url = config.providers[provider].url
+    base_url = get_catalog().providers[provider].url
 
     if provider == "hf":
         base_url = f"{base_url}/{model}/v1"
 
+    # Deterministic requests (temperature 0 or pinned seed) can be replayed from the completion cache.
+    # At temperature 0 the seed doesn't change the answer, so it is left out of the key.
+    key = None
+    if cache and config.cache.text_enabled:
+        key_parameters = {**parameters, **kwargs}
+        if key_parameters.get("temperature") == 0:
+            key_parameters.pop("seed", None)
+        key = cache_key(provider, base_url, key_parameters)
+    if key:
+        data = await asyncio.to_thread(text_cache.get, key)
+        if data is not None:
+            lines = data.decode("utf-8").splitlines(keepends=True)
+            async with aclosing(instrument(_replay(lines), provider, model, cached=True)) as stream:
+                async for line in stream:
+                    yield line
+            return
+
+    # The model's rate limit slot is held until the stream ends
+    async def generate():
+        client = await get_sdk_client(provider, api_key, base_url)
+        async with admitted(provider, model, request_tokens(parameters), queue):
+            if provider == "anthropic":
+                messages = client.messages
+                request = parameters
+                if config.prompt_caching:
+                    messages = client.beta.prompt_caching.messages
+                    request = with_cache_control(parameters)
+                async with messages.stream(**request, **kwargs) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    message = await stream.get_final_message()
+                    if usage is not None:
+                        usage.update(message.usage.model_dump(exclude_none=True))
+            else:
+                stream = await client.chat.completions.create(stream=True, **parameters, **kwargs)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+
+    # Closed explicitly so a stopped stream releases the connection and is recorded right away.
+    # Failures before the first token are retried; after that the text has been shown, so they aren't.
+    chunks = []
+    async with aclosing(instrument(retry_stream(provider, generate), provider, model, usage)) as stream:
+        async for text in stream:
+            chunks.append(text)
+            yield text
+
+    # Only complete responses are cached
+    if key:
+        await asyncio.to_thread(text_cache.set, key, "".join(chunks).encode("utf-8"))
+
+
+# Stream from the first backend to send a token. Equivalent backends (same model family) are only started
+# when the ones already running are slower than the primary's recent time to first token, or have failed.
+async def txt2txt_hedged_stream_async(api_keys, provider, parameters, cache=False, usage=None, queue=None):
+    loop = asyncio.get_running_loop()
+    model = parameters.get("model", "")
+    streams = []
+
+    def attempt(backend_provider, backend_model):
+        async def first_chunk():
+            backend_parameters = parameters
+            # Only the primary request's place in line is shown
+            backend_queue = queue
+            if backend_provider != provider or backend_model != model:
+                backend_queue = None
+                model_config = get_catalog().model("text", backend_provider, backend_model)
+                backend_parameters = translate_text_parameters(
+                    parameters, backend_provider, backend_model, model_config
+                )
+            api_key = api_keys.get(backend_provider) or get_catalog().providers[backend_provider].api_key
+            backend_usage = {}
+            stream = txt2txt_stream_async(
+                api_key, backend_provider, backend_parameters, cache, backend_usage, backend_queue
+            )
+            streams.append(stream)
+
+            start = loop.time()
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                chunk = ""
+            record_latency("text", backend_provider, backend_model, loop.time() - start)
+            return stream, chunk, backend_usage
+
+        return first_chunk
+
+    attempts = [attempt(*backend) for backend in hedge_backends("text", provider, model, api_keys)]
+    _, result = await race(
+        attempts, hedge_delay("text", provider, model), lambda r: not isinstance(r, BaseException)
+    )
+
+    winner = None if isinstance(result, BaseException) else result[0]
+    for stream in streams:
+        if stream is not winner:
+            await stream.aclose()
+    if winner is None:
+        raise result
+
+    _, chunk, backend_usage = result
+    try:
+        if chunk:
+            yield chunk
+        async for text in winner:
+            yield text
+    finally:
+        await winner.aclose()
+        if usage is not None:
+            usage.update(backend_usage)
+
+
+# Stream from the selected model, or from its configured fallback model when the provider is down (retries
+# exhausted or circuit breaker open) before the first token
+async def txt2txt_failover_stream_async(api_keys, provider, parameters, cache=False, usage=None, queue=None):
+    model = parameters.get("model", "")
+    api_key = api_keys.get(provider) or get_catalog().providers[provider].api_key
+    async with aclosing(txt2txt_stream_async(api_key, provider, parameters, cache, usage, queue)) as stream:
+        try:
+            chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            fallback = fallback_backend("text", provider, model, api_keys)
+            if fallback is None or not should_fail_over(e, provider):
+                raise
+        else:
+            yield chunk
+            async for chunk in stream:
+                yield chunk
+            return
+
+    fallback_provider, fallback_model = fallback
+    model_config = get_catalog().model("text", fallback_provider, fallback_model)
+    fallback_parameters = translate_text_parameters(
+        parameters, fallback_provider, fallback_model, model_config
+    )
+    api_key = api_keys.get(fallback_provider) or get_catalog().providers[fallback_provider].api_key
+    fallback_stream = txt2txt_stream_async(
+        api_key, fallback_provider, fallback_parameters, cache, usage, queue
+    )
+    async with aclosing(fallback_stream) as stream:
+        async for chunk in stream:
+            yield chunk
+
+
+def txt2txt_generate(api_key, provider, parameters, cache=False, usage=None, api_keys=None, **kwargs):
+    queue = QueueStatus()
     try:
-        if provider == "anthropic":
-            client = Anthropic(api_key=api_key)
-            with client.messages.stream(**parameters, **kwargs) as stream:
-                return st.write_stream(stream.text_stream)
+        if api_keys is not None:
+            api_keys = {**api_keys, provider: api_key}
+        if config.hedge.enabled and api_keys is not None:
+            stream = txt2txt_hedged_stream_async(api_keys, provider, parameters, cache, usage, queue)
+        elif api_keys is not None:
+            stream = txt2txt_failover_stream_async(api_keys, provider, parameters, cache, usage, queue)
         else:
-            client = OpenAI(api_key=api_key, base_url=base_url)
-            stream = client.chat.completions.create(stream=True, **parameters, **kwargs)
-            return st.write_stream(stream)
-    except AnthropicAPIError as e:
-        return e.message
-    except OpenAIAPIError as e:
+            stream = txt2txt_stream_async(api_key, provider, parameters, cache, usage, queue, **kwargs)
+        with queue_caption(queue) as progress:
+            return st.write_stream(iterate(stream, progress))
+    except Exception as e:
+        if not isinstance(e, loaded_errors("APIError")):
+            return str(e)
         # OpenAI uses this message for streaming errors and attaches response.error to error.body
         # https://github.com/openai/openai-python/blob/v1.0.0/src/openai/_streaming.py#L59
         return e.body if e.message == "An error occurred during streaming" else e.message
-    except Exception as e:
-        return str(e)
 
 
-def txt2img_generate(api_key, provider, model, inputs, parameters, **kwargs):
+# Stream an image body into one growing buffer instead of buffering the response and copying it. The buffer
+# is a `BytesIO` because `getvalue` hands over its bytes without the copy `bytes(bytearray)` would make.
+# The format is checked from the first bytes and the size from the headers, so bad responses stop early.
+async def read_image(response):
+    length = int(response.headers.get("content-length", 0))
+    if length > config.max_image_bytes:
+        raise ValueError(f"Error: image is too large ({length} bytes)")
+
+    buffer = BytesIO()
+    header = b""
+    async for chunk in response.aiter_bytes():
+        buffer.write(chunk)
+        if buffer.tell() > config.max_image_bytes:
+            raise ValueError(f"Error: image is larger than {config.max_image_bytes} bytes")
+        if len(header) < IMAGE_HEADER_BYTES:
+            header += chunk[: IMAGE_HEADER_BYTES - len(header)]
+            if len(header) == IMAGE_HEADER_BYTES and image_format(header) is None:
+                break
+
+    if image_format(header) is None:
+        raise ValueError(f"Error: response is not an image ({response.headers.get('content-type')})")
+    return buffer.getvalue()
+
+
+# Non-2xx responses raise `ProviderError`, so they're retried like transport errors
+async def download_image(client, url, headers, timeout):
+    async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+        if response.status_code // 100 != 2:
+            await response.aread()
+            raise ProviderError(response.status_code, response.text, response.headers)
+        return await read_image(response)
+
+
+async def _txt2img_generate(api_key, provider, model, inputs, parameters, cache=False, queue=None, **kwargs):
     headers = {}
     json = {**parameters, **kwargs}
 
@@ -54,7 +305,7 @@ def txt2img_generate(api_key, provider, model, inputs, parameters, **kwargs):
     if provider == "hf":
         headers["Authorization"] = f"Bearer {api_key}"
         headers["X-Wait-For-Model"] = "true"
-        headers["X-Use-Cache"] = "false"
+        headers["X-Use-Cache"] = "true" if cache else "false"
         json = {
             "inputs": inputs,
             "parameters": {**parameters, **kwargs},
@@ -64,59 +315,212 @@ def txt2img_generate(api_key, provider, model, inputs, parameters, **kwargs):
         headers["Authorization"] = f"Bearer {api_key}"
         json["prompt"] = inputs
 
-    base_url = config.providers[provider].url
+    base_url = get_catalog().providers[provider].url
 
     if provider not in ["together"]:
         base_url = f"{base_url}/{model}"
 
-    try:
-        timeout = config.timeout
-        response = httpx.post(base_url, headers=headers, json=json, timeout=timeout)
+    # One wall-clock deadline covers submit, polling, and download
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.timeout
+
+    # Deterministic requests (pinned seed) are served from the shared image cache
+    key = cache_key(provider, model, base_url, json) if cache else None
+    if key:
+        data = await asyncio.to_thread(image_cache.get, key)
+        if data is not None:
+            return StoredImage.from_bytes(data, cached=True)
+
+    # The image itself, or the JSON body pointing at it
+    async def submit(client):
+        async with client.stream(
+            "POST", base_url, headers=headers, json=json, timeout=config.timeout
+        ) as response:
+            # Hugging Face responds with the image itself
+            if provider == "hf" and response.status_code // 100 == 2:
+                return await read_image(response)
+
+            # Sync mode means the image is a base64 data URL in the JSON body instead of a CDN link
+            if provider == "fal" and parameters.get("sync_mode", True) and response.status_code // 100 == 2:
+                decoder = Base64DataURLDecoder()
+                async for chunk in response.aiter_bytes():
+                    decoder.feed(chunk)
+                    if decoder.size > config.max_image_bytes:
+                        raise ValueError(f"Error: image is larger than {config.max_image_bytes} bytes")
+                    if decoder.done:
+                        data = decoder.close()
+                        if image_format(data) is None:
+                            raise ValueError(f"Error: data URL is not an image ({decoder.mime_type})")
+                        return data
+                return loads(decoder.text)
+
+            await response.aread()
+
+        if response.status_code // 100 != 2:
+            raise ProviderError(response.status_code, response.text, response.headers)
+        return response.json()
+
+    # The model's rate limit slot is held until the image is downloaded; time waiting for it counts toward
+    # the deadline
+    async def generate():
+        client = await get_http_client(provider)
+        async with admitted(provider, model, status=queue):
+            # Only the submit creates (and bills) a generation, so it's the only step retried from the start.
+            # Polling and the download are retried on their own with the job or URL they already have.
+            body = await with_retries(provider, lambda: submit(client), deadline)
+            if isinstance(body, bytes):
+                return body
 
-        if response.status_code // 100 == 2:  # 2xx
             # BFL is async so we need to poll for result
             # https://api.bfl.ml/docs
             if provider == "bfl":
-                id = response.json()["id"]
-                url = f"{config.providers[provider].url}/get_result?id={id}"
-
-                retries = 0
-                while retries < timeout:
-                    response = httpx.get(url, timeout=timeout)
-                    if response.status_code // 100 != 2:
-                        return f"Error: {response.status_code} {response.text}"
-
-                    if response.json()["status"] == "Ready":
-                        image = httpx.get(
-                            response.json()["result"]["sample"],
-                            headers=headers,
-                            timeout=timeout,
-                        )
-                        return Image.open(BytesIO(image.content))
-
-                    retries += 1
-                    time.sleep(1)
-
-                return "Error: API timeout"
-
-            if provider == "fal":
-                # Sync mode means wait for image base64 string instead of CDN link
-                url = response.json()["images"][0]["url"]
-                if parameters.get("sync_mode", True):
-                    return base64_decode_image_data_url(url)
-                else:
-                    image = httpx.get(url, headers=headers, timeout=timeout)
-                    return Image.open(BytesIO(image.content))
-
-            if provider == "hf":
-                return Image.open(BytesIO(response.content))
-
-            if provider == "together":
-                url = response.json()["data"][0]["url"]
-                image = httpx.get(url, headers=headers, timeout=timeout)
-                return Image.open(BytesIO(image.content))
+                result_url = f"{get_catalog().providers[provider].url}/get_result?id={body['id']}"
+                model_config = get_catalog().model("image", provider, model)
+                interval_range = getattr(model_config, "poll_interval_range", None) or POLL_INTERVAL_RANGE
+                result = await with_retries(
+                    provider,
+                    lambda: get_poller().wait(client, result_url, interval_range, deadline),
+                    deadline,
+                )
+                url = result["result"]["sample"]
+            elif provider == "together":
+                url = body["data"][0]["url"]
+            else:
+                url = body["images"][0]["url"]
 
-        else:
-            return f"Error: {response.status_code} {response.text}"
+            return await with_retries(
+                provider, lambda: download_image(client, url, headers, deadline - loop.time()), deadline
+            )
+
+    data = await asyncio.wait_for(generate(), timeout=deadline - loop.time())
+    image = StoredImage.from_bytes(data)
+    if key:
+        await asyncio.to_thread(image_cache.set, key, data)
+    return image
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "Error: API timeout"
+    return str(error)
+
+
+async def txt2img_generate_async(
+    api_key, provider, model, inputs, parameters, cache=False, queue=None, **kwargs
+):
+    try:
+        return await _txt2img_generate(api_key, provider, model, inputs, parameters, cache, queue, **kwargs)
     except Exception as e:
-        return str(e)
+        return _error_message(e)
+
+
+def txt2img_generate(api_key, provider, model, inputs, parameters, cache=False, **kwargs):
+    queue = QueueStatus()
+    with queue_caption(queue) as progress:
+        return run(
+            txt2img_generate_async(api_key, provider, model, inputs, parameters, cache, queue, **kwargs),
+            progress,
+        )
+
+
+# Generate with the selected model, and with its configured fallback model when the provider is down (retries
+# exhausted or circuit breaker open)
+async def txt2img_failover_async(api_keys, provider, model, inputs, parameters, cache=False, queue=None):
+    api_key = api_keys.get(provider) or get_catalog().providers[provider].api_key
+    fallback = fallback_backend("image", provider, model, api_keys)
+    if fallback is None:
+        return await txt2img_generate_async(api_key, provider, model, inputs, parameters, cache, queue)
+
+    try:
+        return await _txt2img_generate(api_key, provider, model, inputs, parameters, cache, queue)
+    except Exception as e:
+        if not should_fail_over(e, provider):
+            return _error_message(e)
+
+    fallback_provider, fallback_model = fallback
+    model_config = get_catalog().model("image", fallback_provider, fallback_model)
+    fallback_parameters = translate_image_parameters(parameters, fallback_model, model_config)
+    api_key = api_keys.get(fallback_provider) or get_catalog().providers[fallback_provider].api_key
+    return await txt2img_generate_async(
+        api_key, fallback_provider, fallback_model, inputs, fallback_parameters, cache, queue
+    )
+
+
+def txt2img_failover(api_keys, provider, model, inputs, parameters, cache=False):
+    queue = QueueStatus()
+    with queue_caption(queue) as progress:
+        return run(
+            txt2img_failover_async(api_keys, provider, model, inputs, parameters, cache, queue), progress
+        )
+
+
+# Send the request to the primary backend and, if it takes longer than its recent p-latency (or fails), to
+# an equivalent one as well, and return the first image. The slower request is cancelled; a job the provider
+# has already accepted may still run to completion on their side.
+async def txt2img_hedged_async(api_keys, provider, model, inputs, parameters, cache=False, queue=None):
+    loop = asyncio.get_running_loop()
+
+    def attempt(backend_provider, backend_model):
+        async def generate():
+            backend_parameters = parameters
+            # Only the primary request's place in line is shown
+            backend_queue = queue
+            if backend_provider != provider or backend_model != model:
+                backend_queue = None
+                model_config = get_catalog().model("image", backend_provider, backend_model)
+                backend_parameters = translate_image_parameters(parameters, backend_model, model_config)
+            api_key = api_keys.get(backend_provider) or get_catalog().providers[backend_provider].api_key
+
+            start = loop.time()
+            image = await txt2img_generate_async(
+                api_key, backend_provider, backend_model, inputs, backend_parameters, cache, backend_queue
+            )
+            # Cache hits return instantly, so only images the provider generated count toward the threshold
+            if isinstance(image, StoredImage) and not image.cached:
+                record_latency("image", backend_provider, backend_model, loop.time() - start)
+            return image
+
+        return generate
+
+    attempts = [attempt(*backend) for backend in hedge_backends("image", provider, model, api_keys)]
+    _, image = await race(
+        attempts, hedge_delay("image", provider, model), lambda r: isinstance(r, StoredImage)
+    )
+    return image
+
+
+def txt2img_hedged(api_keys, provider, model, inputs, parameters, cache=False):
+    queue = QueueStatus()
+    with queue_caption(queue) as progress:
+        return run(
+            txt2img_hedged_async(api_keys, provider, model, inputs, parameters, cache, queue), progress
+        )
+
+
+# Run one request per parameter variation, at most `concurrency` at a time, yielding (index, result) as
+# each one finishes
+async def txt2img_batch_async(
+    api_key, provider, model, inputs, variations, concurrency=1, cache=False, **kwargs
+):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(index, parameters):
+        async with semaphore:
+            image = await txt2img_generate_async(
+                api_key, provider, model, inputs, parameters, cache, **kwargs
+            )
+            return index, image
+
+    tasks = [asyncio.ensure_future(generate(i, parameters)) for i, parameters in enumerate(variations)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def txt2img_batch(api_key, provider, model, inputs, variations, concurrency=1, cache=False, **kwargs):
+    return iterate(
+        txt2img_batch_async(api_key, provider, model, inputs, variations, concurrency, cache, **kwargs)
+    )
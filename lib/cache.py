@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Optional
+
+from .config import config
+
+
+# Stable digest of a request; dict keys are sorted so parameter order doesn't matter
+def cache_key(*parts) -> str:
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Content-addressed files on disk with least-recently-used eviction once `max_bytes` is exceeded.
+# The index is rebuilt from the files on first use, so it survives restarts and is shared by every session
+# in the process. A file's access time orders the LRU and its modification time is when it was written,
+# which is what `ttl` (seconds) is measured against. Small hot entries can also be kept in memory, up to
+# `memory_bytes`.
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int, ttl: Optional[float] = None, memory_bytes: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = None  # key -> (size, written_at)
+        self._size = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        files = []
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_atime, name, stat.st_size, stat.st_mtime))
+
+        self._entries = OrderedDict((name, (size, mtime)) for _, name, size, mtime in sorted(files))
+        self._size = sum(size for size, _ in self._entries.values())
+
+    def _expired(self, written_at: float) -> bool:
+        return self.ttl is not None and time.time() - written_at > self.ttl
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        self._memory_size += len(data) - len(self._memory.pop(key, b""))
+        self._memory[key] = data
+        while self._memory_size > self.memory_bytes:
+            _, old_data = self._memory.popitem(last=False)
+            self._memory_size -= len(old_data)
+
+    def _discard(self, key: str):
+        size, _ = self._entries.pop(key, (0, 0))
+        self._size -= size
+        self._memory_size -= len(self._memory.pop(key, b""))
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Bump the access time only, the modification time is the TTL reference
+            os.utime(path, (time.time(), entry[1]))
+        except FileNotFoundError:
+            with self._lock:
+                self._discard(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            if self.memory_bytes:
+                self._remember(key, data)
+            self.hits += 1
+        return data
+
+    def set(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so readers never see a partial file
+        with NamedTemporaryFile(dir=os.path.dirname(path), prefix=".", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+
+        with self._lock:
+            self._load()
+            self._size += len(data) - self._entries.pop(key, (0, 0))[0]
+            self._entries[key] = (len(data), time.time())
+            if self.memory_bytes:
+                self._remember(key, data)
+
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key = next(iter(self._entries))
+                self._discard(old_key)
+                self.evictions += 1
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries or {}),
+                "bytes": self._size,
+                "memory_bytes": self._memory_size,
+            }
+
+
+image_cache = DiskCache(os.path.join(config.cache.directory, "images"), config.cache.image_max_bytes)
+
+text_cache = DiskCache(
+    os.path.join(config.cache.directory, "text"),
+    config.cache.text_max_bytes,
+    ttl=config.cache.text_ttl,
+    memory_bytes=config.cache.text_memory_bytes,
+)
+
+# Images that pushed a session over `session_image_bytes`
+spill_cache = DiskCache(os.path.join(config.cache.directory, "spill"), config.cache.spill_max_bytes)
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import time
+import tomllib
+from dataclasses import dataclass, field, fields
+from threading import Lock
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from .config import (
+    CircuitBreakerConfig,
+    ImageModelConfig,
+    ModelConfig,
+    ModelListConfig,
+    ProviderConfig,
+    RateLimitConfig,
+    RetryConfig,
+    TextModelConfig,
+    config,
+)
+
+MODEL_TYPES = {"text": TextModelConfig, "image": ImageModelConfig}
+
+logger = logging.getLogger(__name__)
+
+_current = None
+_checked_at = 0.0
+_error = None
+_reload_lock = Lock()
+
+
+class CatalogError(ValueError):
+    pass
+
+
+# The providers and models in the catalog file, with the lookups the pages and request code make on every
+# rerun built once per load. Disabled providers and models are left out entirely.
+@dataclass(frozen=True, slots=True)
+class Catalog:
+    providers: Mapping[str, ProviderConfig]
+    # Providers with at least one model of the kind, in file order
+    text_providers: Mapping[str, ProviderConfig]
+    image_providers: Mapping[str, ProviderConfig]
+    # (kind, provider, model) -> model
+    models: Mapping[Tuple[str, str, str], ModelConfig]
+    # (kind, family) -> (provider, model) of every backend serving it, in file order
+    families: Mapping[Tuple[str, str], Tuple[Tuple[str, str], ...]]
+    path: str = ""
+    # Identifies the file version loaded (modification time, size, inode)
+    signature: Tuple[int, int, int] = (0, 0, 0)
+    loaded_at: float = field(default_factory=time.time)
+
+    def model(self, kind: str, provider: str, model: str) -> Optional[ModelConfig]:
+        return self.models.get((kind, provider, model))
+
+    # A text or image model, for code that only has the provider and model ID
+    def any_model(self, provider: str, model: str) -> Optional[ModelConfig]:
+        return self.models.get(("text", provider, model)) or self.models.get(("image", provider, model))
+
+
+# Lists become tuples and tables read-only mappings, all the way down
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _settings(settings_type, table: Optional[dict]):
+    if table is None:
+        return None
+    return settings_type(**{k: _freeze(v) for k, v in table.items()})
+
+
+def _model(model_type, presets: dict, table: dict) -> Optional[ModelConfig]:
+    settings = {}
+    for preset in table.get("presets", []):
+        if preset not in presets:
+            raise CatalogError(f"unknown preset {preset!r}")
+        settings.update(presets[preset])
+    settings.update({k: v for k, v in table.items() if k != "presets"})
+    if not settings.pop("enabled", True):
+        return None
+
+    rate_limit = _settings(RateLimitConfig, settings.pop("rate_limit", None))
+    names = {f.name for f in fields(model_type)}
+    unknown = [k for k in settings if k not in names]
+    if unknown:
+        raise CatalogError(f"unknown settings {', '.join(unknown)}")
+    return model_type(rate_limit=rate_limit, **{k: _freeze(v) for k, v in settings.items()})
+
+
+def _provider(presets: dict, table: dict) -> Optional[ProviderConfig]:
+    table = dict(table)
+    if not table.pop("enabled", True):
+        return None
+
+    models = {}
+    for kind, model_type in MODEL_TYPES.items():
+        models[kind] = {}
+        for model_id, model_table in table.pop(kind, {}).items():
+            try:
+                model_config = _model(model_type, presets, model_table)
+            except (CatalogError, TypeError, ValueError) as e:
+                raise CatalogError(f"{kind}.{model_id}: {e}") from e
+            if model_config is not None:
+                models[kind][model_id] = model_config
+
+    api_key_env = table.pop("api_key_env", None)
+    return ProviderConfig(
+        name=table.pop("name"),
+        url=table.pop("url"),
+        api_key=os.environ.get(api_key_env) if api_key_env else None,
+        text=MappingProxyType(models["text"]),
+        image=MappingProxyType(models["image"]),
+        retry=_settings(RetryConfig, table.pop("retry", None)),
+        circuit_breaker=_settings(CircuitBreakerConfig, table.pop("circuit_breaker", None)),
+        rate_limit=_settings(RateLimitConfig, table.pop("rate_limit", None)),
+        discovery=_settings(ModelListConfig, table.pop("discovery", None)),
+        **table,
+    )
+
+
+# Build a catalog from the parsed file: presets are merged into models, API keys are read from the
+# environment variables named by `api_key_env`, and the indexes are filled in
+def parse_catalog(data: dict, path: str = "", signature: Tuple[int, int, int] = (0, 0, 0)) -> Catalog:
+    presets = data.get("presets", {})
+    providers = {}
+    for provider_id, table in data.get("providers", {}).items():
+        try:
+            provider_config = _provider(presets, table)
+        except (CatalogError, KeyError, TypeError, ValueError) as e:
+            raise CatalogError(f"providers.{provider_id}: {e}") from e
+        if provider_config is not None:
+            providers[provider_id] = provider_config
+
+    models = {}
+    families = {}
+    for provider_id, provider_config in providers.items():
+        for kind in MODEL_TYPES:
+            for model_id, model_config in getattr(provider_config, kind).items():
+                models[(kind, provider_id, model_id)] = model_config
+                if model_config.family:
+                    families.setdefault((kind, model_config.family), []).append((provider_id, model_id))
+
+    return Catalog(
+        providers=MappingProxyType(providers),
+        text_providers=MappingProxyType({k: v for k, v in providers.items() if v.text}),
+        image_providers=MappingProxyType({k: v for k, v in providers.items() if v.image}),
+        models=MappingProxyType(models),
+        families=MappingProxyType({k: tuple(v) for k, v in families.items()}),
+        path=path,
+        signature=signature,
+    )
+
+
+def _signature(path: str) -> Tuple[int, int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+# The catalog file as parsed TOML, or JSON when its name ends in .json
+def read_catalog(path: str) -> dict:
+    with open(path, "rb") as f:
+        try:
+            return json.load(f) if path.endswith(".json") else tomllib.load(f)
+        except (json.JSONDecodeError, tomllib.TOMLDecodeError) as e:
+            raise CatalogError(f"{path}: {e}") from e
+
+
+def load_catalog(path: str) -> Catalog:
+    # Taken before reading, so a write that lands during the read is picked up by the next check
+    signature = _signature(path)
+    data = read_catalog(path)
+    try:
+        return parse_catalog(data, path, signature)
+    except CatalogError as e:
+        raise CatalogError(f"{path}: {e}") from e
+
+
+# Checked recently, and still the configured file
+def _fresh(current: Optional[Catalog]) -> bool:
+    return (
+        current is not None
+        and current.path == config.catalog.path
+        and time.monotonic() - _checked_at < config.catalog.reload_interval
+    )
+
+
+# The current catalog. At most every `reload_interval` seconds one caller checks whether the file has
+# changed and, if so, loads it and swaps it in whole; everyone else keeps using the catalog they have
+# meanwhile. A file that fails to load leaves the previous catalog in place (the first load has nothing to
+# fall back on, so it raises).
+def get_catalog() -> Catalog:
+    global _current, _checked_at, _error
+
+    current = _current
+    if _fresh(current):
+        return current
+    if not _reload_lock.acquire(blocking=current is None):
+        return current
+
+    try:
+        if _fresh(_current):
+            return _current
+        _checked_at = time.monotonic()
+        path = config.catalog.path
+        try:
+            if _current is not None and _current.path == path and _current.signature == _signature(path):
+                return _current
+            _current = load_catalog(path)
+            _error = None
+        except (OSError, CatalogError) as e:
+            if _current is None:
+                raise
+            if str(e) != _error:
+                logger.warning("Keeping the previous catalog: %s", e)
+            _error = str(e)
+        return _current
+    finally:
+        _reload_lock.release()
+
+
+def catalog_status() -> dict:
+    current = get_catalog()
+    return {
+        "path": current.path,
+        "loaded_at": current.loaded_at,
+        "providers": len(current.providers),
+        "models": len(current.models),
+        "error": _error,
+    }
@@ -0,0 +1,93 @@
+import asyncio
+import sys
+from collections import OrderedDict
+from hashlib import sha256
+from importlib import import_module
+from threading import Lock
+from typing import TYPE_CHECKING, Tuple, Type
+from weakref import WeakKeyDictionary
+
+from .config import config
+
+if TYPE_CHECKING:
+    import httpx
+
+# Async clients are bound to the event loop that created them, so pools are kept per loop.
+# In the app that is always the shared loop from `lib.loop`.
+_http_clients = WeakKeyDictionary()
+_http_clients_lock = Lock()
+
+_sdk_clients = OrderedDict()
+_sdk_clients_lock = Lock()
+
+# httpx and the provider SDKs are imported the first time a request needs them rather than with the page
+# (the SDKs take most of a second each)
+SDK_MODULES = ("anthropic", "openai")
+_modules = {}
+
+
+# Import on a worker thread so the shared event loop keeps serving other sessions meanwhile
+async def load_module(name: str):
+    if name not in _modules:
+        _modules[name] = await asyncio.to_thread(import_module, name)
+    return _modules[name]
+
+
+# An exception class from each of `modules` imported so far. A library that hasn't been imported can't have
+# raised anything, so callers can check errors against these without importing it.
+def loaded_errors(name: str, modules: Tuple[str, ...] = SDK_MODULES) -> Tuple[Type[BaseException], ...]:
+    loaded = [sys.modules[module] for module in modules if module in sys.modules]
+    # A module still being imported may not have defined it yet
+    return tuple(error for error in (getattr(module, name, None) for module in loaded) if error is not None)
+
+
+# One pooled client per provider, shared by every Streamlit session in the process.
+# Submit, poll, and download requests reuse the same keep-alive (and HTTP/2 where supported) connections.
+async def get_http_client(provider: str) -> "httpx.AsyncClient":
+    httpx = await load_module("httpx")
+    loop = asyncio.get_running_loop()
+
+    with _http_clients_lock:
+        clients = _http_clients.setdefault(loop, {})
+        client = clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=config.http.http2,
+                timeout=config.timeout,
+                limits=httpx.Limits(
+                    max_connections=config.http.max_connections,
+                    max_keepalive_connections=config.http.max_keepalive_connections,
+                    keepalive_expiry=config.http.keepalive_expiry,
+                ),
+            )
+            clients[provider] = client
+        return client
+
+
+# SDK clients keep their own connection pool, so reuse them across chat turns.
+# The cache key uses a digest of the API key so the raw key is never stored outside the client, and a
+# client is only ever returned to a caller presenting the same key.
+async def get_sdk_client(provider: str, api_key: str, base_url: str):
+    sdk = await load_module("anthropic" if provider == "anthropic" else "openai")
+    loop = asyncio.get_running_loop()
+    key = (loop, provider, base_url, sha256((api_key or "").encode("utf-8")).hexdigest())
+
+    with _sdk_clients_lock:
+        client = _sdk_clients.get(key)
+        if client is not None:
+            _sdk_clients.move_to_end(key)
+            return client
+
+        # Retries are handled by `lib.retry` so they share the provider's backoff and circuit breaker
+        if provider == "anthropic":
+            client = sdk.AsyncAnthropic(api_key=api_key, max_retries=0)
+        else:
+            client = sdk.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        _sdk_clients[key] = client
+
+        # Evicted clients are not closed here because a stream may still be using one; the SDK closes its
+        # connection pool when the last reference goes away.
+        while len(_sdk_clients) > config.http.max_sdk_clients:
+            _sdk_clients.popitem(last=False)
+
+        return client
@@ -1,58 +1,46 @@
 import os
+import tempfile
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Union
-
-TEXT_SYSTEM_PROMPT = "You are a helpful assistant. Be precise and concise."
-
-IMAGE_NEGATIVE_PROMPT = "ugly, unattractive, disfigured, deformed, mutated, malformed, blurry, grainy, oversaturated, undersaturated, overexposed, underexposed, worst quality, low details, lowres, watermark, signature, sloppy, cluttered"
-
-FOOOCUS_NEGATIVE_PROMPT = "(worst quality, low quality, normal quality, lowres, low details, oversaturated, undersaturated, overexposed, underexposed, grayscale, bw, bad photo, bad photography, bad art:1.4), (watermark, signature, text font, username, error, logo, words, letters, digits, autograph, trademark, name:1.2), (blur, blurry, grainy), morbid, ugly, asymmetrical, mutated malformed, mutilated, poorly lit, bad shadow, draft, cropped, out of frame, cut off, censored, jpeg artifacts, out of focus, glitch, duplicate, (airbrushed, cartoon, anime, semi-realistic, cgi, render, blender, digital art, manga, amateur:1.3), (3D ,3D Game, 3D Game Scene, 3D Character:1.1), (bad hands, bad anatomy, bad body, bad face, bad teeth, bad arms, bad legs, deformities:1.3)"
-
-IMAGE_SIZES = [
-    "landscape_16_9",
-    "landscape_4_3",
-    "square_hd",
-    "portrait_4_3",
-    "portrait_16_9",
-]
-
-IMAGE_ASPECT_RATIOS = [
-    "704x1408",  # 1:2
-    "704x1344",  # 11:21
-    "768x1344",  # 4:7
-    "768x1280",  # 3:5
-    "832x1216",  # 13:19
-    "832x1152",  # 13:18
-    "896x1152",  # 7:9
-    "896x1088",  # 14:17
-    "960x1088",  # 15:17
-    "960x1024",  # 15:16
-    "1024x1024",
-    "1024x960",  # 16:15
-    "1088x960",  # 17:15
-    "1088x896",  # 17:14
-    "1152x896",  # 9:7
-    "1152x832",  # 18:13
-    "1216x832",  # 19:13
-    "1280x768",  # 5:3
-    "1344x768",  # 7:4
-    "1344x704",  # 21:11
-    "1408x704",  # 2:1
-]
-
-IMAGE_RANGE = (256, 1408)
-
-STRENGTH_RANGE = (0.0, 1.0)
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple, Union
 
+# Output dimensions of fal's named image sizes
+# https://fal.ai/models/fal-ai/flux/dev/api
+IMAGE_SIZE_DIMENSIONS = {
+    "square_hd": (1024, 1024),
+    "square": (512, 512),
+    "portrait_4_3": (768, 1024),
+    "portrait_16_9": (576, 1024),
+    "landscape_4_3": (1024, 768),
+    "landscape_16_9": (1024, 576),
+}
 
-@dataclass
+# Seconds between result polls for async providers (first, longest)
+POLL_INTERVAL_RANGE = (0.5, 2.0)
+
+
+# Catalog entries, from rate limits up to providers, are frozen: a reload builds new ones and swaps the
+# whole catalog, so a session never sees a half-updated model
+@dataclass(frozen=True, slots=True)
+class RateLimitConfig:
+    rpm: Optional[int] = None  # requests per minute
+    tpm: Optional[int] = None  # prompt and max output tokens per minute (text models)
+    concurrency: Optional[int] = None  # requests in flight
+
+
+@dataclass(frozen=True, slots=True)
 class ModelConfig:
     name: str
-    parameters: List[str]
-    kwargs: Optional[Dict[str, Union[str, int, float, bool]]] = field(default_factory=dict)
+    parameters: Tuple[str, ...]
+    kwargs: Mapping[str, Union[str, int, float, bool, tuple]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    family: Optional[str] = None
+    fallback: Optional[Tuple[str, str]] = None
+    rate_limit: Optional[RateLimitConfig] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TextModelConfig(ModelConfig):
     system_prompt: Optional[str] = None
     frequency_penalty: Optional[float] = None
@@ -63,9 +51,10 @@ class TextModelConfig(ModelConfig):
     max_tokens_range: Optional[tuple[int, int]] = None
     temperature: Optional[float] = None
     temperature_range: Optional[tuple[float, float]] = None
+    context_window: Optional[int] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ImageModelConfig(ModelConfig):
     negative_prompt: Optional[str] = None
     width: Optional[int] = None
@@ -75,22 +64,112 @@ class ImageModelConfig(ModelConfig):
     strength: Optional[float] = None
     strength_range: Optional[tuple[float, float]] = None
     image_size: Optional[str] = None
-    image_sizes: Optional[List[str]] = field(default_factory=list)
+    image_sizes: Tuple[str, ...] = ()
     aspect_ratio: Optional[str] = None
-    aspect_ratios: Optional[List[str]] = field(default_factory=list)
+    aspect_ratios: Tuple[str, ...] = ()
     guidance_scale: Optional[float] = None
     guidance_scale_range: Optional[tuple[float, float]] = None
     num_inference_steps: Optional[int] = None
     num_inference_steps_range: Optional[tuple[int, int]] = None
+    poll_interval_range: Optional[tuple[float, float]] = None
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class RetryConfig:
+    attempts: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    max_retry_after: float = 30.0
+    statuses: Tuple[int, ...] = (408, 429, 500, 502, 503, 504, 529)
+
+
+@dataclass(frozen=True, slots=True)
+class CircuitBreakerConfig:
+    failures: int = 5
+    reset_timeout: float = 30.0
+
+
+# Where a provider lists the models it serves. `format` is "data" (`{"data": [{"id": ...}]}`, following
+# `has_more`/`last_id` pages), "list" (`[{"id": ...}]`), or "status" (`url` has a `{model}` placeholder and is
+# requested per model; 404 or 410 means the model is gone).
+@dataclass(frozen=True, slots=True)
+class ModelListConfig:
+    url: str
+    format: str = "data"
+
+
+@dataclass(frozen=True, slots=True)
 class ProviderConfig:
     name: str
     url: str
     api_key: Optional[str]
-    text: Optional[Dict[str, TextModelConfig]] = field(default_factory=dict)
-    image: Optional[Dict[str, ImageModelConfig]] = field(default_factory=dict)
+    text: Mapping[str, TextModelConfig] = field(default_factory=lambda: MappingProxyType({}))
+    image: Mapping[str, ImageModelConfig] = field(default_factory=lambda: MappingProxyType({}))
+    retry: Optional[RetryConfig] = None
+    circuit_breaker: Optional[CircuitBreakerConfig] = None
+    rate_limit: Optional[RateLimitConfig] = None
+    discovery: Optional[ModelListConfig] = None
+
+
+@dataclass
+class CatalogConfig:
+    path: str = os.path.join(os.path.dirname(__file__), "catalog.toml")
+    reload_interval: float = 2.0
+
+
+@dataclass
+class DiscoveryConfig:
+    enabled: bool = True
+    ttl: float = 60 * 60
+    max_stale: float = 24 * 60 * 60
+    retry_interval: float = 5 * 60
+    timeout: float = 10.0
+
+
+@dataclass
+class HttpConfig:
+    http2: bool = True
+    max_connections: Optional[int] = 100
+    max_keepalive_connections: Optional[int] = 20
+    keepalive_expiry: Optional[float] = 30.0
+    max_sdk_clients: int = 64
+
+
+@dataclass
+class CacheConfig:
+    directory: str = os.path.join(tempfile.gettempdir(), "playground")
+    image_max_bytes: int = 1 << 30
+    text_enabled: bool = False
+    text_ttl: Optional[float] = 24 * 60 * 60
+    text_max_bytes: int = 64 << 20
+    text_memory_bytes: int = 8 << 20
+    spill_max_bytes: int = 4 << 30
+
+
+@dataclass
+class HedgeConfig:
+    enabled: bool = False
+    max_hedges: int = 1
+    percentile: int = 95
+    window: int = 200
+    min_samples: int = 20
+    image_delay: float = 20.0
+    text_delay: float = 5.0
+
+
+@dataclass
+class JobsConfig:
+    workers: int = 8
+    max_session_jobs: int = 4
+    poll_interval: float = 0.5
+    ttl: float = 60 * 60
+
+
+@dataclass
+class MetricsConfig:
+    enabled: bool = True
+    window: int = 1000
+    log_path: Optional[str] = None
 
 
 @dataclass
@@ -100,58 +179,143 @@ class AppConfig:
     logo: str
     timeout: int
     hidden_parameters: List[str]
-    providers: Dict[str, ProviderConfig]
-
-
-_anthropic_text_kwargs = {
-    "system_prompt": TEXT_SYSTEM_PROMPT,
-    "max_tokens": 512,
-    "max_tokens_range": (512, 4096),
-    "temperature": 0.5,
-    "temperature_range": (0.0, 1.0),
-    "parameters": ["max_tokens", "temperature"],
-}
+    diagnostics: bool = False
+    catalog: CatalogConfig = field(default_factory=CatalogConfig)
+    discovery: DiscoveryConfig = field(default_factory=DiscoveryConfig)
+    http: HttpConfig = field(default_factory=HttpConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    hedge: HedgeConfig = field(default_factory=HedgeConfig)
+    jobs: JobsConfig = field(default_factory=JobsConfig)
+    retry: RetryConfig = field(default_factory=RetryConfig)
+    circuit_breaker: CircuitBreakerConfig = field(default_factory=CircuitBreakerConfig)
+    failover: bool = True
+    rate_limit: RateLimitConfig = field(default_factory=RateLimitConfig)
+    history_turns: int = 10
+    context_budget: Optional[int] = None
+    context_trim_turns: int = 8
+    prompt_caching: bool = True
+    batch_max_images: int = 16
+    batch_max_concurrency: int = 4
+    session_image_bytes: int = 32 << 20
+    max_image_bytes: int = 64 << 20
+    upload_resize: bool = True
+    upload_quality: int = 90
+    upload_cache_bytes: int = 64 << 20
 
-_hf_text_kwargs = {
-    "system_prompt": TEXT_SYSTEM_PROMPT,
-    "frequency_penalty": 0.0,
-    "frequency_penalty_range": (-2.0, 2.0),
-    "max_tokens": 512,
-    "max_tokens_range": (512, 4096),
-    "temperature": 1.0,
-    "temperature_range": (0.0, 2.0),
-    "parameters": ["max_tokens", "temperature", "frequency_penalty", "seed"],
-}
-
-_openai_text_kwargs = {
-    "system_prompt": TEXT_SYSTEM_PROMPT,
-    "frequency_penalty": 0.0,
-    "frequency_penalty_range": (-2.0, 2.0),
-    "presence_penalty": 0.0,
-    "presence_penalty_range": (-2.0, 2.0),
-    "max_tokens": 512,
-    "max_tokens_range": (512, 4096),
-    "temperature": 1.0,
-    "temperature_range": (0.0, 2.0),
-    "parameters": ["max_tokens", "temperature", "frequency_penalty", "presence_penalty", "seed"],
-}
-
-_pplx_text_kwargs = {
-    "system_prompt": TEXT_SYSTEM_PROMPT,
-    "frequency_penalty": 1.0,
-    "frequency_penalty_range": (1.0, 2.0),
-    "max_tokens": 512,
-    "max_tokens_range": (512, 4096),
-    "temperature": 1.0,
-    "temperature_range": (0.0, 2.0),
-    "parameters": ["max_tokens", "temperature", "frequency_penalty"],
-}
 
 config = AppConfig(
     title="Playground",
     layout="wide",
     logo="logo.svg",
     timeout=60,
+    # Providers and models (TOML, or JSON with a .json extension), checked for changes every
+    # `reload_interval` seconds
+    catalog=CatalogConfig(
+        path=os.environ.get("PLAYGROUND_CATALOG", os.path.join(os.path.dirname(__file__), "catalog.toml")),
+        reload_interval=2.0,
+    ),
+    # Providers with a `discovery` listing and an API key in the environment are asked which models they
+    # serve, in the background and shared by all sessions. Models they no longer list are hidden. A listing
+    # is refreshed after `ttl` seconds (the old one is used meanwhile) and ignored past `max_stale`; failed
+    # listings are retried after `retry_interval`.
+    discovery=DiscoveryConfig(
+        enabled=True,
+        ttl=60 * 60,  # 1 hour
+        max_stale=24 * 60 * 60,  # 1 day
+        retry_interval=5 * 60,
+        timeout=10.0,
+    ),
+    # Most prompt tokens sent per chat turn (older turns are dropped to fit); `None` means the model's
+    # context window less `max_tokens`
+    context_budget=32_000,
+    # Older turns are dropped this many at a time, so the kept history (and its prompt cache entry) only
+    # changes every few turns
+    context_trim_turns=8,
+    # Anthropic prompt caching for the system prompt and conversation prefix
+    prompt_caching=True,
+    # Turns of chat history rendered in full (more are loaded on request)
+    history_turns=10,
+    # Batch mode on the Text to Image page (variations per prompt, requests in flight per batch)
+    batch_max_images=16,
+    batch_max_concurrency=4,
+    # Connection pool shared by all sessions (one client per provider)
+    http=HttpConfig(
+        http2=True,
+        max_connections=100,
+        max_keepalive_connections=20,
+        keepalive_expiry=30.0,
+        # Anthropic/OpenAI clients are per API key; past this many the least recently used are dropped from
+        # the cache (not closed, a stream may still be using them)
+        max_sdk_clients=64,
+    ),
+    # Images generated with a pinned seed are cached on disk and shared by all sessions.
+    # Text completions with temperature 0 or a pinned seed are only cached when `text_enabled` is set.
+    cache=CacheConfig(
+        directory=os.environ.get("PLAYGROUND_CACHE_DIR", os.path.join(tempfile.gettempdir(), "playground")),
+        image_max_bytes=1 << 30,  # 1 GiB
+        text_enabled=os.environ.get("PLAYGROUND_TEXT_CACHE", "").lower() in ["1", "true"],
+        text_ttl=24 * 60 * 60,  # 1 day
+        text_max_bytes=64 << 20,  # 64 MiB
+        text_memory_bytes=8 << 20,  # 8 MiB
+        spill_max_bytes=4 << 30,  # 4 GiB
+    ),
+    # The Diagnostics page shows every session's metrics, queues and jobs plus the catalog path and errors, so
+    # it's only served to operators who turn it on
+    diagnostics=os.environ.get("PLAYGROUND_DIAGNOSTICS", "").lower() in ["1", "true"],
+    # Streaming latency and throughput of the last `window` text generations, shown on the Diagnostics page.
+    # Each stream is also appended to `log_path` as JSONL when set.
+    metrics=MetricsConfig(
+        enabled=True,
+        window=1000,
+        log_path=os.environ.get("PLAYGROUND_METRICS_LOG"),
+    ),
+    # Requests failing with these statuses or a connection error are retried with jittered exponential
+    # backoff (or after Retry-After). Providers can override both policies.
+    retry=RetryConfig(
+        attempts=3,
+        backoff=0.5,
+        max_backoff=8.0,
+        max_retry_after=30.0,
+        statuses=(408, 429, 500, 502, 503, 504, 529),
+    ),
+    # After `failures` retryable failures in a row a provider is skipped for `reset_timeout` seconds
+    circuit_breaker=CircuitBreakerConfig(failures=5, reset_timeout=30.0),
+    # Models with a `fallback` (provider, model) are retried there when their provider is down
+    failover=True,
+    # Requests to each model wait in a first-come, first-served queue shared by all sessions so bursts stay
+    # under the provider's limits. Providers and models can override it.
+    rate_limit=RateLimitConfig(rpm=None, tpm=None, concurrency=16),
+    # Send a slow request to an equivalent backend too (same model `family` on another provider) once the
+    # primary is past its recent p95 time to image or first token, and keep whichever answers first. Until
+    # `min_samples` requests have been seen the fixed delays are used.
+    hedge=HedgeConfig(
+        enabled=os.environ.get("PLAYGROUND_HEDGE", "").lower() in ["1", "true"],
+        max_hedges=1,
+        percentile=95,
+        window=200,
+        min_samples=20,
+        image_delay=20.0,
+        text_delay=5.0,
+    ),
+    # Image generations run as background jobs on a pool of `workers` shared by all sessions (single images
+    # before batches). Pages poll for results every `poll_interval` seconds; results survive a browser
+    # refresh and are dropped `ttl` seconds after finishing if nobody collects them.
+    jobs=JobsConfig(
+        workers=8,
+        max_session_jobs=4,
+        poll_interval=0.5,
+        ttl=60 * 60,  # 1 hour
+    ),
+    # Larger image responses are rejected while downloading
+    max_image_bytes=64 << 20,  # 64 MiB
+    # Uploaded images (image-to-image) are shrunk and center-cropped to the output size before encoding;
+    # encoded uploads are cached by content so reruns don't redo the work
+    upload_resize=True,
+    upload_quality=90,
+    upload_cache_bytes=64 << 20,  # 64 MiB
+    # Generated images past this many bytes per session are moved from session state to disk
+    session_image_bytes=32 << 20,  # 32 MiB
     hidden_parameters=[
         # Sent to API but not shown in generation parameters accordion
         "enable_safety_checker",
@@ -168,360 +332,4 @@ config = AppConfig(
         "styles",
         "sync_mode",
     ],
-    providers={
-        "anthropic": ProviderConfig(
-            name="Anthropic",
-            url="https://api.anthropic.com/v1",
-            api_key=os.environ.get("ANTHROPIC_API_KEY"),
-            text={
-                "claude-3-haiku-20240307": TextModelConfig("Claude 3 Haiku", **_anthropic_text_kwargs),
-                "claude-3-opus-20240229": TextModelConfig("Claude 3 Opus", **_anthropic_text_kwargs),
-                "claude-3-sonnet-20240229": TextModelConfig("Claude 3 Sonnet", **_anthropic_text_kwargs),
-                "claude-3-5-sonnet-20240620": TextModelConfig("Claude 3.5 Sonnet", **_anthropic_text_kwargs),
-            },
-        ),
-        "bfl": ProviderConfig(
-            name="Black Forest Labs",
-            url="https://api.bfl.ml/v1",
-            api_key=os.environ.get("BFL_API_KEY"),
-            image={
-                "flux-pro-1.1": ImageModelConfig(
-                    "FLUX1.1 Pro",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    parameters=["seed", "width", "height", "prompt_upsampling"],
-                    kwargs={"safety_tolerance": 6},
-                ),
-                "flux-pro": ImageModelConfig(
-                    "FLUX.1 Pro",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    guidance_scale=2.5,
-                    guidance_scale_range=(1.5, 5.0),
-                    num_inference_steps=50,
-                    num_inference_steps_range=(10, 50),
-                    parameters=["seed", "width", "height", "steps", "guidance", "prompt_upsampling"],
-                    kwargs={"safety_tolerance": 6, "interval": 1},
-                ),
-                "flux-dev": ImageModelConfig(
-                    "FLUX.1 Dev",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    num_inference_steps=28,
-                    num_inference_steps_range=(10, 50),
-                    guidance_scale=3.0,
-                    guidance_scale_range=(1.5, 5.0),
-                    parameters=["seed", "width", "height", "steps", "guidance", "prompt_upsampling"],
-                    kwargs={"safety_tolerance": 6},
-                ),
-            },
-        ),
-        "fal": ProviderConfig(
-            name="Fal",
-            url="https://fal.run",
-            api_key=os.environ.get("FAL_KEY"),
-            image={
-                "fal-ai/aura-flow": ImageModelConfig(
-                    "AuraFlow",
-                    guidance_scale=3.5,
-                    guidance_scale_range=(0.0, 20.0),
-                    num_inference_steps=50,
-                    num_inference_steps_range=(20, 50),
-                    parameters=["seed", "num_inference_steps", "guidance_scale", "expand_prompt"],
-                    kwargs={"num_images": 1, "sync_mode": False},
-                ),
-                "fal-ai/fast-sdxl": ImageModelConfig(
-                    "Fast SDXL",
-                    negative_prompt=IMAGE_NEGATIVE_PROMPT,
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    guidance_scale=7.5,
-                    guidance_scale_range=(0.0, 20.0),
-                    num_inference_steps=25,
-                    num_inference_steps_range=(1, 50),
-                    parameters=[
-                        "seed",
-                        "negative_prompt",
-                        "image_size",
-                        "num_inference_steps",
-                        "guidance_scale",
-                        "expand_prompt",
-                    ],
-                    kwargs={
-                        "num_images": 1,
-                        "sync_mode": False,
-                        "enable_safety_checker": False,
-                        "output_format": "png",
-                    },
-                ),
-                "fal-ai/fast-sdxl/image-to-image": ImageModelConfig(
-                    "Fast SDXL (Image)",
-                    negative_prompt=IMAGE_NEGATIVE_PROMPT,
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    strength=0.95,
-                    strength_range=STRENGTH_RANGE,
-                    guidance_scale=7.5,
-                    guidance_scale_range=(0.0, 20.0),
-                    num_inference_steps=25,
-                    num_inference_steps_range=(1, 50),
-                    parameters=[
-                        "seed",
-                        "negative_prompt",
-                        "image_size",
-                        "num_inference_steps",
-                        "guidance_scale",
-                        "strength",
-                        "expand_prompt",
-                        "image_url",
-                    ],
-                    kwargs={
-                        "num_images": 1,
-                        "sync_mode": False,
-                        "enable_safety_checker": False,
-                        "output_format": "png",
-                    },
-                ),
-                "fal-ai/flux-pro/v1.1": ImageModelConfig(
-                    "FLUX1.1 Pro",
-                    parameters=["seed", "image_size"],
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    kwargs={
-                        "num_images": 1,
-                        "sync_mode": False,
-                        "safety_tolerance": 6,
-                        "enable_safety_checker": False,
-                    },
-                ),
-                "fal-ai/flux-pro": ImageModelConfig(
-                    "FLUX.1 Pro",
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    guidance_scale=2.5,
-                    guidance_scale_range=(1.5, 5.0),
-                    num_inference_steps=40,
-                    num_inference_steps_range=(10, 50),
-                    parameters=["seed", "image_size", "num_inference_steps", "guidance_scale"],
-                    kwargs={"num_images": 1, "sync_mode": False, "safety_tolerance": 6},
-                ),
-                "fal-ai/flux/dev": ImageModelConfig(
-                    "FLUX.1 Dev",
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    num_inference_steps=28,
-                    num_inference_steps_range=(10, 50),
-                    guidance_scale=3.0,
-                    guidance_scale_range=(1.5, 5.0),
-                    parameters=["seed", "image_size", "num_inference_steps", "guidance_scale"],
-                    kwargs={"num_images": 1, "sync_mode": False, "enable_safety_checker": False},
-                ),
-                "fal-ai/flux/dev/image-to-image": ImageModelConfig(
-                    "FLUX.1 Dev (Image)",
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    strength=0.95,
-                    strength_range=STRENGTH_RANGE,
-                    num_inference_steps=28,
-                    num_inference_steps_range=(10, 50),
-                    guidance_scale=3.0,
-                    guidance_scale_range=(1.5, 5.0),
-                    parameters=[
-                        "seed",
-                        "image_size",
-                        "num_inference_steps",
-                        "guidance_scale",
-                        "strength",
-                        "image_url",
-                    ],
-                    kwargs={"num_images": 1, "sync_mode": False, "enable_safety_checker": False},
-                ),
-                "fal-ai/flux/schnell": ImageModelConfig(
-                    "FLUX.1 Schnell",
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    num_inference_steps=4,
-                    num_inference_steps_range=(1, 12),
-                    parameters=["seed", "image_size", "num_inference_steps"],
-                    kwargs={"num_images": 1, "sync_mode": False, "enable_safety_checker": False},
-                ),
-                "fal-ai/fooocus": ImageModelConfig(
-                    "Fooocus",
-                    negative_prompt=FOOOCUS_NEGATIVE_PROMPT,
-                    aspect_ratio="1024x1024",
-                    aspect_ratios=IMAGE_ASPECT_RATIOS,
-                    guidance_scale=4.0,
-                    guidance_scale_range=(1.0, 15.0),
-                    parameters=["seed", "negative_prompt", "aspect_ratio", "guidance_scale"],
-                    # TODO: more of these can be params
-                    kwargs={
-                        "num_images": 1,
-                        "sync_mode": True,
-                        "enable_safety_checker": False,
-                        "output_format": "png",
-                        "sharpness": 2,
-                        "styles": ["Fooocus Enhance", "Fooocus V2", "Fooocus Sharp"],
-                        "performance": "Quality",
-                    },
-                ),
-                "fal-ai/kolors": ImageModelConfig(
-                    "Kolors",
-                    negative_prompt=IMAGE_NEGATIVE_PROMPT,
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    guidance_scale=5.0,
-                    guidance_scale_range=(1.0, 10.0),
-                    num_inference_steps=50,
-                    num_inference_steps_range=(10, 50),
-                    parameters=[
-                        "seed",
-                        "negative_prompt",
-                        "image_size",
-                        "guidance_scale",
-                        "num_inference_steps",
-                    ],
-                    kwargs={
-                        "num_images": 1,
-                        "sync_mode": True,
-                        "enable_safety_checker": False,
-                        "scheduler": "EulerDiscreteScheduler",
-                    },
-                ),
-                "fal-ai/stable-diffusion-v3-medium": ImageModelConfig(
-                    "SD3 Medium",
-                    image_size="square_hd",
-                    image_sizes=IMAGE_SIZES,
-                    guidance_scale=5.0,
-                    guidance_scale_range=(1.0, 10.0),
-                    num_inference_steps=28,
-                    num_inference_steps_range=(10, 50),
-                    parameters=[
-                        "seed",
-                        "negative_prompt",
-                        "image_size",
-                        "guidance_scale",
-                        "num_inference_steps",
-                        "prompt_expansion",
-                    ],
-                    kwargs={"num_images": 1, "sync_mode": True, "enable_safety_checker": False},
-                ),
-            },
-        ),
-        "hf": ProviderConfig(
-            name="Hugging Face",
-            url="https://api-inference.huggingface.co/models",
-            api_key=os.environ.get("HF_TOKEN"),
-            text={
-                "codellama/codellama-34b-instruct-hf": TextModelConfig("Code Llama 34B", **_hf_text_kwargs),
-                "meta-llama/llama-2-13b-chat-hf": TextModelConfig("Meta Llama 2 13B", **_hf_text_kwargs),
-                "mistralai/mistral-7b-instruct-v0.2": TextModelConfig("Mistral 0.2 7B", **_hf_text_kwargs),
-                "nousresearch/nous-hermes-2-mixtral-8x7b-dpo": TextModelConfig(
-                    "Nous Hermes 2 Mixtral 8x7B",
-                    **_hf_text_kwargs,
-                ),
-            },
-            image={
-                "black-forest-labs/flux.1-dev": ImageModelConfig(
-                    "FLUX.1 Dev",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    guidance_scale=3.0,
-                    guidance_scale_range=(1.5, 5.0),
-                    num_inference_steps=28,
-                    num_inference_steps_range=(10, 50),
-                    parameters=["width", "height", "guidance_scale", "num_inference_steps"],
-                ),
-                "black-forest-labs/flux.1-schnell": ImageModelConfig(
-                    "FLUX.1 Schnell",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    num_inference_steps=4,
-                    num_inference_steps_range=(1, 12),
-                    parameters=["width", "height", "num_inference_steps"],
-                    kwargs={"guidance_scale": 0.0, "max_sequence_length": 256},
-                ),
-                "stabilityai/stable-diffusion-xl-base-1.0": ImageModelConfig(
-                    "Stable Diffusion XL 1.0",
-                    negative_prompt=IMAGE_NEGATIVE_PROMPT,
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    guidance_scale=7.0,
-                    guidance_scale_range=(1.0, 15.0),
-                    num_inference_steps=40,
-                    num_inference_steps_range=(10, 50),
-                    parameters=[
-                        "seed",
-                        "negative_prompt",
-                        "width",
-                        "height",
-                        "guidance_scale",
-                        "num_inference_steps",
-                    ],
-                ),
-            },
-        ),
-        "openai": ProviderConfig(
-            name="OpenAI",
-            url="https://api.openai.com/v1",
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            text={
-                "chatgpt-4o-latest": TextModelConfig("ChatGPT-4o", **_openai_text_kwargs),
-                "gpt-3.5-turbo": TextModelConfig("GPT-3.5 Turbo", **_openai_text_kwargs),
-                "gpt-4-turbo": TextModelConfig("GPT-4 Turbo", **_openai_text_kwargs),
-                "gpt-4o": TextModelConfig("GPT-4o", **_openai_text_kwargs),
-                "gpt-4o-mini": TextModelConfig("GPT-4o mini", **_openai_text_kwargs),
-                "o1-preview": TextModelConfig("o1-preview", **_openai_text_kwargs),
-                "o1-mini": TextModelConfig("o1-mini", **_openai_text_kwargs),
-            },
-        ),
-        "pplx": ProviderConfig(
-            name="Perplexity",
-            url="https://api.perplexity.ai",
-            api_key=os.environ.get("PPLX_API_KEY"),
-            text={
-                "sonar-reasoning": TextModelConfig(
-                    "Sonar Reasoning",
-                    **_pplx_text_kwargs,
-                ),
-                "sonar-pro": TextModelConfig(
-                    "Sonar Pro",
-                    **_pplx_text_kwargs,
-                ),
-                "sonar": TextModelConfig(
-                    "Sonar",
-                    **_pplx_text_kwargs,
-                ),
-            },
-        ),
-        "together": ProviderConfig(
-            name="Together",
-            url="https://api.together.xyz/v1/images/generations",
-            api_key=os.environ.get("TOGETHER_API_KEY"),
-            image={
-                "black-forest-labs/FLUX.1-schnell-Free": ImageModelConfig(
-                    "FLUX.1 Schnell Free",
-                    width=1024,
-                    width_range=IMAGE_RANGE,
-                    height=1024,
-                    height_range=IMAGE_RANGE,
-                    num_inference_steps=4,
-                    num_inference_steps_range=(1, 12),
-                    parameters=["model", "seed", "width", "height", "steps"],
-                    kwargs={"n": 1},
-                ),
-            },
-        ),
-    },
 )
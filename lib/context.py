@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Optional
+
+from .config import TextModelConfig, config
+
+# Rough tokenizer-free estimate: about 4 characters per token for English, plus the role/separator tokens
+# every chat message carries
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+
+
+@dataclass
+class ContextReport:
+    budget: int
+    tokens: int
+    saved_tokens: int = 0
+    dropped_messages: int = 0
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content")) + TOKENS_PER_MESSAGE
+
+
+# Prompt tokens available for a turn: the model's context window less the completion, capped by config
+def context_budget(model_config: TextModelConfig, max_tokens: Optional[int] = None) -> Optional[int]:
+    budgets = []
+    if model_config.context_window:
+        budgets.append(model_config.context_window - (max_tokens or model_config.max_tokens or 0))
+    if config.context_budget:
+        budgets.append(config.context_budget)
+    return min(budgets) if budgets else None
+
+
+# Drop the oldest user/assistant turns until the prompt fits the budget.
+# The history is cut at fixed turns counted from the start of the chat, so once turns start being dropped the
+# kept prefix stays the same for several turns and the prompt cache can still read it. Cuts are
+# `context_trim_turns` apart, or half as many turns as fit when that's fewer, so a cut never drops more than
+# half of the history that would fit.
+# The system message and the latest user message are always kept; if those alone are over budget the
+# request is sent as is and the provider decides.
+def fit_context(messages, model_config: TextModelConfig, max_tokens=None, system=None):
+    budget = context_budget(model_config, max_tokens)
+    pinned = estimate_tokens(system)
+    head = []
+    if messages and messages[0]["role"] == "system":
+        head = messages[:1]
+        messages = messages[1:]
+    pinned += sum(estimate_message_tokens(m) for m in head)
+
+    tokens = [estimate_message_tokens(m) for m in messages]
+    total = pinned + sum(tokens)
+    if budget is None or total <= budget:
+        return head + messages, ContextReport(budget=budget or 0, tokens=total)
+
+    # Prompt tokens when the history starts at each message
+    remaining = list(accumulate(reversed(tokens)))[::-1]
+
+    # Keep turns whole so the history always starts with a user message
+    turns = [i for i, m in enumerate(messages) if m["role"] == "user" and i > 0]
+    # The oldest turn the history could start at; if even the newest is over budget it's sent alone
+    first = next((n for n, i in enumerate(turns) if pinned + remaining[i] <= budget), len(turns) - 1)
+    fit = len(turns) - 1 - first
+    stride = max(1, min(config.context_trim_turns, fit // 2))
+    start = turns[-(-(first + 1) // stride) * stride - 1] if turns else len(messages) - 1
+
+    kept = pinned + remaining[start]
+    report = ContextReport(budget=budget, tokens=kept, saved_tokens=total - kept, dropped_messages=start)
+    return head + messages[start:], report
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Optional, Tuple
+
+from .catalog import get_catalog
+from .clients import get_http_client
+from .config import ModelConfig, ModelListConfig, ProviderConfig, config
+from .loop import get_loop
+
+# Per-model status codes meaning the provider no longer serves the model
+GONE_STATUSES = [404, 410]
+
+logger = logging.getLogger(__name__)
+
+_listings = {}  # provider -> Listing
+_refreshing = set()  # providers with a refresh scheduled or running
+_listings_lock = Lock()
+
+
+# What a provider last said about its models, shared by every session and replaced whole on each refresh.
+# IDs are lowercase. `models` is `None` for providers checked model by model, which fill `gone` instead.
+@dataclass(frozen=True)
+class Listing:
+    provider: str
+    models: Optional[FrozenSet[str]] = None
+    gone: FrozenSet[str] = frozenset()
+    fetched_at: Optional[float] = None
+    attempted_at: Optional[float] = None
+    # Why the last attempt failed; the previous listing is kept
+    error: Optional[str] = None
+
+
+def _headers(provider: str, api_key: str) -> dict:
+    if provider == "anthropic":
+        return {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+async def _fetch(
+    provider: str, settings: ModelListConfig, api_key: str, model_ids
+) -> Tuple[Optional[FrozenSet[str]], FrozenSet[str]]:
+    client = await get_http_client(provider)
+    headers = _headers(provider, api_key)
+
+    if settings.format == "status":
+
+        async def status(model_id):
+            response = await client.get(settings.url.format(model=model_id), headers=headers)
+            return model_id, response.status_code
+
+        results = await asyncio.gather(*[status(model_id) for model_id in model_ids])
+        return None, frozenset(m.lower() for m, code in results if code in GONE_STATUSES)
+
+    models = set()
+    params = {}
+    while True:
+        response = await client.get(settings.url, headers=headers, params=params)
+        if response.status_code // 100 != 2:
+            raise ValueError(f"{response.status_code} {response.reason_phrase}")
+        body = response.json()
+        entries = body if settings.format == "list" else body["data"]
+        models.update(entry["id"].lower() for entry in entries)
+        if settings.format == "list" or not body.get("has_more") or not body.get("last_id"):
+            return frozenset(models), frozenset()
+        params = {"after_id": body["last_id"]}
+
+
+async def _refresh(provider: str):
+    try:
+        provider_config = get_catalog().providers.get(provider)
+        if provider_config is None or provider_config.discovery is None or not provider_config.api_key:
+            return
+        model_ids = {*provider_config.text, *provider_config.image}
+        try:
+            models, gone = await asyncio.wait_for(
+                _fetch(provider, provider_config.discovery, provider_config.api_key, model_ids),
+                config.discovery.timeout,
+            )
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning("Listing %s models failed: %s", provider, error)
+            with _listings_lock:
+                _listings[provider] = replace(_listings[provider], error=error)
+            return
+        with _listings_lock:
+            _listings[provider] = replace(
+                _listings[provider], models=models, gone=gone, fetched_at=time.time(), error=None
+            )
+    finally:
+        with _listings_lock:
+            _refreshing.discard(provider)
+
+
+# A listing is refreshed when it's older than `ttl` or than the catalog (models may have been added). After
+# a failure, the next attempt waits `retry_interval`.
+def _due(listing: Optional[Listing], loaded_at: float) -> bool:
+    if listing is None:
+        return True
+    now = time.time()
+    if listing.error is not None:
+        return now - listing.attempted_at >= config.discovery.retry_interval
+    return (
+        listing.fetched_at is None
+        or now - listing.fetched_at >= config.discovery.ttl
+        or listing.fetched_at < loaded_at
+    )
+
+
+# The provider's current listing, scheduling a refresh on the shared loop when it's due. Never waits for it.
+def _listing(provider: str, loaded_at: float) -> Optional[Listing]:
+    with _listings_lock:
+        listing = _listings.get(provider)
+        if provider in _refreshing or not _due(listing, loaded_at):
+            return listing
+        _refreshing.add(provider)
+        _listings[provider] = replace(listing or Listing(provider), attempted_at=time.time())
+    asyncio.run_coroutine_threadsafe(_refresh(provider), get_loop())
+    return listing
+
+
+# Whether the provider still serves the model: `False` only when a listing newer than the catalog and no
+# older than `max_stale` says it's gone, `None` when there's nothing to go on (discovery is off, the provider
+# has no listing or no API key on the server, or the first listing hasn't come back yet)
+def model_available(provider: str, model: str) -> Optional[bool]:
+    current = get_catalog()
+    provider_config = current.providers.get(provider)
+    if not config.discovery.enabled or provider_config is None or provider_config.discovery is None:
+        return None
+    if not provider_config.api_key:
+        return None
+
+    listing = _listing(provider, current.loaded_at)
+    if listing is None or listing.fetched_at is None:
+        return None
+    if (
+        listing.fetched_at < current.loaded_at
+        or time.time() - listing.fetched_at > config.discovery.max_stale
+    ):
+        return None
+    model = model.lower()
+    if model in listing.gone:
+        return False
+    if listing.models is None:
+        return None
+    return model in listing.models
+
+
+def visible_models(provider: str, models: Mapping[str, ModelConfig]) -> Dict[str, ModelConfig]:
+    return {m: c for m, c in models.items() if model_available(provider, m) is not False}
+
+
+# The catalog's providers of a kind with the models their listings no longer include left out, and providers
+# left with none dropped. Refreshes happen in the background, so this never waits on the network.
+def visible_providers(kind: str) -> Dict[str, ProviderConfig]:
+    providers = {}
+    for provider_id, provider_config in getattr(get_catalog(), f"{kind}_providers").items():
+        models = getattr(provider_config, kind)
+        visible = visible_models(provider_id, models)
+        if len(visible) < len(models):
+            if not visible:
+                continue
+            provider_config = replace(provider_config, **{kind: MappingProxyType(visible)})
+        providers[provider_id] = provider_config
+    return providers
+
+
+def listings() -> Dict[str, Listing]:
+    with _listings_lock:
+        return dict(_listings)
@@ -0,0 +1,151 @@
+import asyncio
+from collections import deque
+from statistics import quantiles
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from .catalog import get_catalog
+from .config import IMAGE_SIZE_DIMENSIONS, ImageModelConfig, TextModelConfig, config
+from .discovery import model_available
+from .util import target_image_size
+
+# Canonical name of each image parameter that means the same thing under different names
+IMAGE_PARAMETER_ALIASES = {
+    "steps": "num_inference_steps",
+    "guidance": "guidance_scale",
+}
+
+_latencies = {}
+_latencies_lock = Lock()
+
+
+# Completion time (images) or time to first token (text) of recent requests per backend
+def record_latency(kind: str, provider: str, model: str, seconds: float):
+    with _latencies_lock:
+        samples = _latencies.setdefault((kind, provider, model), deque(maxlen=config.hedge.window))
+        samples.append(seconds)
+
+
+# How long to wait for a backend before hedging: its recent p-latency, or the configured default until
+# there are enough samples
+def hedge_delay(kind: str, provider: str, model: str) -> float:
+    with _latencies_lock:
+        samples = list(_latencies.get((kind, provider, model), []))
+    if len(samples) < config.hedge.min_samples:
+        return config.hedge.image_delay if kind == "image" else config.hedge.text_delay
+    return quantiles(samples, n=100, method="inclusive")[config.hedge.percentile - 1]
+
+
+# Other backends serving the same model family, in config order, that have an API key and that their
+# provider still lists
+def equivalents(kind: str, provider: str, model: str, api_keys: Dict[str, str]) -> List[Tuple[str, str]]:
+    current = get_catalog()
+    family = getattr(current.model(kind, provider, model), "family", None)
+    if not family:
+        return []
+    return [
+        (provider_id, model_id)
+        for provider_id, model_id in current.families[(kind, family)]
+        if (provider_id, model_id) != (provider, model)
+        and (api_keys.get(provider_id) or current.providers[provider_id].api_key)
+        and model_available(provider_id, model_id) is not False
+    ]
+
+
+def _clamp(value, value_range):
+    if value_range is None:
+        return value
+    return min(max(value, value_range[0]), value_range[1])
+
+
+# Carry size, steps, guidance, seed, and negative prompt over to another provider's parameter names.
+# Anything the target doesn't take is dropped, and the target's own fixed kwargs are added.
+def translate_image_parameters(parameters: dict, model: str, model_config: ImageModelConfig) -> dict:
+    canonical = {IMAGE_PARAMETER_ALIASES.get(k, k): v for k, v in parameters.items()}
+    size = target_image_size(parameters)
+
+    translated = {}
+    for param in model_config.parameters:
+        name = IMAGE_PARAMETER_ALIASES.get(param, param)
+        if param == "model":
+            translated[param] = model
+        elif param in ["width", "height"] and size:
+            value = size[0] if param == "width" else size[1]
+            translated[param] = _clamp(value, getattr(model_config, f"{param}_range"))
+        elif param == "image_size" and size:
+            named = [k for k, v in IMAGE_SIZE_DIMENSIONS.items() if v == size]
+            translated[param] = named[0] if named else {"width": size[0], "height": size[1]}
+        elif name == "num_inference_steps" and name in canonical:
+            translated[param] = _clamp(canonical[name], model_config.num_inference_steps_range)
+        elif name == "guidance_scale" and name in canonical:
+            translated[param] = _clamp(canonical[name], model_config.guidance_scale_range)
+        elif param in ["seed", "negative_prompt", "prompt_upsampling"] and param in canonical:
+            translated[param] = canonical[param]
+
+    translated.update(model_config.kwargs or {})
+    return translated
+
+
+# Move the system prompt between Anthropic's `system` parameter and OpenAI's system message, and keep only
+# sampling parameters the target model takes
+def translate_text_parameters(
+    parameters: dict, provider: str, model: str, model_config: TextModelConfig
+) -> dict:
+    messages = list(parameters["messages"])
+    system = parameters.get("system")
+    if messages and messages[0]["role"] == "system":
+        system = messages.pop(0)["content"]
+
+    translated = {"model": model}
+    for param in model_config.parameters:
+        if param in parameters:
+            translated[param] = _clamp(parameters[param], getattr(model_config, f"{param}_range", None))
+
+    if provider == "anthropic":
+        if system:
+            translated["system"] = system
+        translated["messages"] = messages
+    else:
+        translated["messages"] = ([{"role": "system", "content": system}] if system else []) + messages
+    return translated
+
+
+# Primary backend first, then up to `max_hedges` equivalents
+def hedge_backends(kind: str, provider: str, model: str, api_keys: Dict[str, str]) -> List[Tuple[str, str]]:
+    return [(provider, model)] + equivalents(kind, provider, model, api_keys)[: config.hedge.max_hedges]
+
+
+# Start the first attempt, and the next one whenever the running ones haven't succeeded within `delay` or
+# have all failed. The first success wins and the others are cancelled. Returns (index, result) of the
+# winner, or of the last failure when every attempt fails.
+async def race(attempts, delay: float, succeeded) -> Tuple[int, object]:
+    loop = asyncio.get_running_loop()
+    tasks = []
+    last = (0, None)
+    try:
+        tasks.append(loop.create_task(attempts[0]()))
+        while True:
+            pending = [t for t in tasks if not t.done()]
+            more = len(tasks) < len(attempts)
+            if not pending:
+                if not more:
+                    return last
+                tasks.append(loop.create_task(attempts[len(tasks)]()))
+                continue
+
+            done, _ = await asyncio.wait(
+                pending, timeout=delay if more else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                tasks.append(loop.create_task(attempts[len(tasks)]()))
+                continue
+
+            for task in done:
+                result = task.exception() or task.result()
+                if succeeded(result):
+                    return tasks.index(task), result
+                last = (tasks.index(task), result)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,95 @@
+from dataclasses import dataclass, field
+from hashlib import sha256
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image
+
+from .cache import spill_cache
+from .config import config
+
+# Enough leading bytes to recognize every format providers return
+IMAGE_HEADER_BYTES = 12
+
+
+def image_format(header: bytes) -> Optional[str]:
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    if header[:6] in [b"GIF87a", b"GIF89a"]:
+        return "GIF"
+    return None
+
+
+# A generated image kept as its original compressed bytes.
+# Opening with PIL only reads the header, so format and dimensions are known without decoding pixels.
+# When a session goes over its byte budget the bytes move to the spill cache on disk and only the key stays
+# in session state.
+@dataclass
+class StoredImage:
+    format: str
+    width: int
+    height: int
+    size: int
+    data: Optional[bytes] = field(default=None, repr=False)
+    key: Optional[str] = None
+    # Served from the image cache instead of generated by the provider
+    cached: bool = False
+
+    @classmethod
+    def from_bytes(cls, data: bytes, cached: bool = False) -> "StoredImage":
+        image = Image.open(BytesIO(data))
+        return cls(
+            format=image.format,
+            width=image.width,
+            height=image.height,
+            size=len(data),
+            data=data,
+            cached=cached,
+        )
+
+    @property
+    def spilled(self) -> bool:
+        return self.data is None
+
+    def read(self) -> Optional[bytes]:
+        if self.data is not None:
+            return self.data
+        return spill_cache.get(self.key)
+
+    def open(self) -> Optional[Image.Image]:
+        data = self.read()
+        return Image.open(BytesIO(data)) if data is not None else None
+
+    def spill(self):
+        if self.data is None:
+            return
+        self.key = sha256(self.data).hexdigest()
+        spill_cache.set(self.key, self.data)
+        self.data = None
+
+
+def iter_images(messages):
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, StoredImage):
+            yield content
+        if isinstance(content, list):
+            for result in content:
+                if isinstance(result.get("content"), StoredImage):
+                    yield result["content"]
+
+
+# Keep the newest images in memory up to the per-session budget and spill the rest to disk
+def enforce_image_budget(messages, budget: Optional[int] = None):
+    budget = config.session_image_bytes if budget is None else budget
+    total = 0
+    for image in reversed(list(iter_images(messages))):
+        if image.spilled:
+            continue
+        total += image.size
+        if total > budget:
+            image.spill()
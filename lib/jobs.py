@@ -0,0 +1,215 @@
+import asyncio
+import secrets
+import time
+from dataclasses import dataclass, field
+from itertools import count
+from threading import Lock
+from typing import Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from .config import config
+from .limiter import QueueStatus
+from .loop import get_loop, run
+
+# Job priorities, lowest first
+INTERACTIVE = 0
+BATCH = 1
+
+_jobs = {}  # session -> {job id -> Job}, in submission order
+_jobs_lock = Lock()
+
+
+@dataclass
+class Job:
+    id: str
+    session: str
+    # Streamlit session of the tab holding the job; another tab can only claim it once that one is gone
+    tab: str
+    kind: str
+    priority: int
+    work: Callable[["Job"], Awaitable] = field(repr=False)
+    # What the page needs to show the job before and after it finishes (prompt, parameters, ...)
+    request: dict = field(default_factory=dict)
+    status: str = "queued"  # queued, running, done, failed, cancelled
+    result: object = field(default=None, repr=False)
+    # Results of a batch so far, by variation index
+    partial: Dict[int, object] = field(default_factory=dict, repr=False)
+    # Place in the provider's rate limit queue once running
+    queue: QueueStatus = field(default_factory=QueueStatus)
+    # Queued jobs that will start before this one, kept up to date on the event loop
+    ahead: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ["done", "failed", "cancelled"]
+
+
+# A fixed number of workers on the shared event loop run jobs from every session, highest priority first
+# and in submission order within a priority
+class WorkerPool:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+        self.order = count()
+        self.waiting = {}  # order -> queued job
+        self.running = 0
+
+    @property
+    def queued(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def submit(self, job: Job):
+        if self.queue is None:
+            loop = asyncio.get_running_loop()
+            self.queue = asyncio.PriorityQueue()
+            self.tasks = [loop.create_task(self.work()) for _ in range(self.workers)]
+        order = next(self.order)
+        self.waiting[order] = job
+        self.queue.put_nowait((job.priority, order, job))
+        self.reposition()
+
+    # Recount every queued job's place in line. Runs on the loop whenever the queue changes, so script threads
+    # only ever read `Job.ahead`.
+    def reposition(self):
+        waiting = sorted((j.priority, n) for n, j in self.waiting.items() if not j.done)
+        for position, (_, order) in enumerate(waiting):
+            self.waiting[order].ahead = position
+
+    async def work(self):
+        while True:
+            _, order, job = await self.queue.get()
+            self.waiting.pop(order, None)
+            self.reposition()
+            if job.done:
+                continue
+
+            job.status = "running"
+            job.started_at = time.time()
+            job.task = asyncio.get_running_loop().create_task(job.work(job))
+            self.running += 1
+            try:
+                job.result = await job.task
+                job.status = "done"
+            except asyncio.CancelledError:
+                job.status = "cancelled"
+            except Exception as e:
+                # lib.api errors already carry the prefix
+                message = str(e)
+                job.result = message if message.startswith("Error: ") else f"Error: {message}"
+                job.status = "failed"
+            finally:
+                self.running -= 1
+                job.finished_at = time.time()
+
+
+pool = WorkerPool(config.jobs.workers)
+
+
+# Identifies the browser tab across page switches (session state) and refreshes (the URL). The token in the
+# URL is single-use: a tab without one in session state claims the URL's jobs under a new token (see
+# `_claim`), so a copied link stops working as soon as the owner's tab refreshes.
+def session_id() -> str:
+    session = st.session_state.get("job_session")
+    if session is None:
+        session = st.session_state.job_session = _claim(st.query_params.get("session"))
+    if st.query_params.get("session") != session:
+        st.query_params["session"] = session
+    return session
+
+
+# Finished jobs nobody collected (e.g., the tab was closed) are dropped after `ttl` seconds
+def _expire():
+    cutoff = time.time() - config.jobs.ttl
+    for session, jobs in list(_jobs.items()):
+        for job_id, job in list(jobs.items()):
+            if job.done and job.finished_at < cutoff:
+                del jobs[job_id]
+        if not jobs:
+            del _jobs[session]
+
+
+# The Streamlit session running the script, which (unlike the URL) a copied link or duplicated tab doesn't
+# share and a refresh replaces
+def _tab() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else ""
+
+
+def _connected(tab: str) -> bool:
+    return Runtime.exists() and Runtime.instance().is_active_session(tab)
+
+
+# A new token for this tab, taking over the jobs of `session` if their tab is gone (it was refreshed or
+# closed). A token whose tab is still connected, e.g. from a copied link or a duplicated tab, gets nothing.
+def _claim(session: Optional[str]) -> str:
+    claimed = secrets.token_urlsafe(16)
+    tab = _tab()
+    with _jobs_lock:
+        jobs = _jobs.get(session, {})
+        if not jobs or any(_connected(job.tab) for job in jobs.values()):
+            return claimed
+        _jobs[claimed] = _jobs.pop(session)
+        for job in jobs.values():
+            job.session = claimed
+            job.tab = tab
+    return claimed
+
+
+def session_jobs(session: str, kind: Optional[str] = None) -> List[Job]:
+    with _jobs_lock:
+        _expire()
+        return [job for job in _jobs.get(session, {}).values() if kind is None or job.kind == kind]
+
+
+# Queue `work(job)` on the worker pool. Returns `None` when the session already has `max_session_jobs`
+# unfinished jobs.
+def submit_job(
+    session: str, kind: str, work: Callable[[Job], Awaitable], request: dict, priority: int = INTERACTIVE
+) -> Optional[Job]:
+    job = Job(
+        id=uuid4().hex, session=session, tab=_tab(), kind=kind, priority=priority, work=work, request=request
+    )
+    with _jobs_lock:
+        _expire()
+        jobs = _jobs.setdefault(session, {})
+        if sum(1 for j in jobs.values() if not j.done) >= config.jobs.max_session_jobs:
+            return None
+        jobs[job.id] = job
+    run(pool.submit(job))
+    return job
+
+
+# Remove a finished job from the store once its result has been moved into the page's history
+def pop_job(job: Job):
+    with _jobs_lock:
+        _jobs.get(job.session, {}).pop(job.id, None)
+
+
+def cancel_job(job: Job):
+    def cancel():
+        if job.task is not None:
+            job.task.cancel()
+        elif not job.done:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            pool.reposition()
+
+    get_loop().call_soon_threadsafe(cancel)
+    pop_job(job)
+
+
+def job_position(job: Job) -> int:
+    return job.ahead
+
+
+def job_stats() -> dict:
+    return {"workers": pool.workers, "running": pool.running, "queued": pool.queued}
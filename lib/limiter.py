@@ -0,0 +1,252 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from math import ceil
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from .catalog import get_catalog
+from .config import RateLimitConfig, config
+
+# Weight of the latest request in the average time a slot is held
+HOLD_SMOOTHING = 0.2
+
+_limiters = {}
+_limiters_lock = Lock()
+
+
+# Where a session's request is in the admission queue, updated by the limiter while it waits and read by
+# the page to show it. `position` is 0 once the request has been let through.
+@dataclass
+class QueueStatus:
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    position: int = 0
+    wait: Optional[float] = None
+
+
+# What to tell the user about a waiting request, if anything
+def queue_message(status: QueueStatus) -> Optional[str]:
+    if not status.position:
+        return None
+    current = get_catalog()
+    provider_config = current.providers.get(status.provider)
+    model_config = current.any_model(status.provider, status.model)
+    provider_name = provider_config.name if provider_config else status.provider
+    name = f"{provider_name} {model_config.name if model_config else status.model}"
+    message = f"Waiting for {name}: number {status.position} in line"
+    if status.wait is not None:
+        message += f", about {max(status.wait, 1):.0f}s"
+    return message
+
+
+@dataclass
+class TokenBucket:
+    rate: float  # per second
+    capacity: float
+    level: float = 0.0
+    updated: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        self.level = self.capacity
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` can be taken (a request larger than the bucket waits for a full one)
+    def wait_time(self, amount: float, now: float) -> float:
+        self.refill(now)
+        return max(min(amount, self.capacity) - self.level, 0) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass
+class Ticket:
+    tokens: int
+    future: asyncio.Future
+    status: Optional[QueueStatus] = None
+    started: Optional[float] = None
+
+
+# Admits requests to one provider model in arrival order, as fast as its requests-per-minute and
+# tokens-per-minute buckets and in-flight limit allow. Lives on the shared event loop, so one limiter
+# covers every session in the process.
+class Limiter:
+    def __init__(self, provider: str, model: str, settings: RateLimitConfig):
+        self.provider = provider
+        self.model = model
+        self.settings = settings
+        self.requests = self._bucket(None, settings.rpm)
+        self.tokens = self._bucket(None, settings.tpm)
+        self.in_flight = 0
+        self.queue = deque()
+        # Average seconds a request holds its slot, for wait estimates
+        self.hold = None
+        self.timer = None
+
+    @property
+    def queued(self) -> int:
+        return len(self.queue)
+
+    # New limits from a catalog reload. Buckets keep what they had left (up to the new capacity), and
+    # waiting requests are let through if the new limits allow.
+    def configure(self, settings: RateLimitConfig):
+        self.settings = settings
+        self.requests = self._bucket(self.requests, settings.rpm)
+        self.tokens = self._bucket(self.tokens, settings.tpm)
+        if self.queue:
+            self.dispatch()
+
+    @staticmethod
+    def _bucket(bucket: Optional[TokenBucket], per_minute: Optional[int]) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        resized = TokenBucket(per_minute / 60, per_minute)
+        if bucket is not None:
+            bucket.refill(time.monotonic())
+            resized.level = min(bucket.level, resized.capacity)
+        return resized
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0, status: Optional[QueueStatus] = None):
+        ticket = await self.acquire(tokens, status)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, tokens: int = 0, status: Optional[QueueStatus] = None) -> Ticket:
+        ticket = Ticket(tokens, asyncio.get_running_loop().create_future(), status)
+        self.queue.append(ticket)
+        self.dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # Let the next request take the place (or slot) this one is giving up
+            if ticket.started is not None:
+                self.release(ticket)
+            elif ticket in self.queue:
+                self.queue.remove(ticket)
+                self.dispatch()
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket):
+        held = time.monotonic() - ticket.started
+        self.hold = held if self.hold is None else self.hold + HOLD_SMOOTHING * (held - self.hold)
+        self.in_flight -= 1
+        self.dispatch()
+
+    # Let queued requests through from the front until one has to wait, then wake up when the buckets
+    # have refilled enough for it (finished requests wake it up too)
+    def dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        now = time.monotonic()
+        while self.queue:
+            ticket = self.queue[0]
+            if ticket.future.done():
+                self.queue.popleft()
+                continue
+            if self.settings.concurrency and self.in_flight >= self.settings.concurrency:
+                break
+            wait = self.rate_wait(ticket.tokens, now)
+            if wait > 0:
+                self.timer = ticket.future.get_loop().call_later(wait, self.dispatch)
+                break
+
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(ticket.tokens)
+            self.queue.popleft()
+            self.in_flight += 1
+            ticket.started = now
+            if ticket.status is not None:
+                ticket.status.position = 0
+                ticket.status.wait = None
+            ticket.future.set_result(None)
+
+        for position, ticket in enumerate(self.queue, 1):
+            if ticket.status is not None:
+                ticket.status.provider = self.provider
+                ticket.status.model = self.model
+                ticket.status.position = position
+                ticket.status.wait = self.estimate(position, now)
+
+    def rate_wait(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = self.requests.wait_time(1, now)
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    # Rough seconds until the request at `position` gets through: the refill time for everything ahead of
+    # it, or the finishing time of the slots it waits for, whichever is longer. `None` until a request
+    # has finished when only the in-flight limit applies.
+    def estimate(self, position: int, now: float) -> Optional[float]:
+        waits = []
+        if self.requests:
+            self.requests.refill(now)
+            waits.append(max(position - self.requests.level, 0) / self.requests.rate)
+        if self.tokens:
+            self.tokens.refill(now)
+            ahead = sum(t.tokens for t in list(self.queue)[:position])
+            waits.append(max(ahead - self.tokens.level, 0) / self.tokens.rate)
+        if self.settings.concurrency:
+            free = self.settings.concurrency - self.in_flight
+            rounds = ceil(max(position - free, 0) / self.settings.concurrency)
+            if rounds and self.hold is None:
+                return None
+            waits.append(rounds * (self.hold or 0))
+        return max(waits, default=0.0)
+
+
+def rate_limit(provider: str, model: str) -> RateLimitConfig:
+    current = get_catalog()
+    provider_config = current.providers.get(provider)
+    model_config = current.any_model(provider, model)
+    return (
+        getattr(model_config, "rate_limit", None)
+        or getattr(provider_config, "rate_limit", None)
+        or config.rate_limit
+    )
+
+
+# The limiter for a provider model, or `None` when it has no limits. Limits changed in the catalog apply to
+# the existing limiter, so its queue is kept.
+def get_limiter(provider: str, model: str) -> Optional[Limiter]:
+    settings = rate_limit(provider, model)
+    if not (settings.rpm or settings.tpm or settings.concurrency):
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get((provider, model))
+        if limiter is None:
+            limiter = _limiters[(provider, model)] = Limiter(provider, model, settings)
+        elif limiter.settings != settings:
+            limiter.configure(settings)
+        return limiter
+
+
+def limiters() -> Dict[Tuple[str, str], Limiter]:
+    with _limiters_lock:
+        return dict(_limiters)
+
+
+# Hold a slot of the provider model's limiter for the body, waiting in its queue first if needed
+@asynccontextmanager
+async def admitted(provider: str, model: str, tokens: int = 0, status: Optional[QueueStatus] = None):
+    limiter = get_limiter(provider, model)
+    if limiter is None:
+        yield
+        return
+    async with limiter.slot(tokens, status):
+        yield
@@ -0,0 +1,64 @@
+import asyncio
+from concurrent.futures import wait
+from threading import Lock, Thread
+
+# Seconds between `progress` calls while a script thread waits on the loop
+PROGRESS_INTERVAL = 0.25
+
+_loop = None
+_loop_lock = Lock()
+
+
+# A single event loop runs on a daemon thread for the whole process.
+# Every session's requests are scheduled onto it, so many generations and polls share one thread.
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is not None:
+        return _loop
+
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name="lib-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+# Wait for a future from the shared loop, calling `progress` every so often (e.g., to update the page).
+# If `progress` raises (e.g., the script is stopped), the work on the loop is cancelled.
+def _result(future, progress=None):
+    try:
+        if progress is not None:
+            while not wait([future], timeout=PROGRESS_INTERVAL).done:
+                progress()
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+
+# Block the calling (script) thread until the coroutine finishes on the shared loop
+def run(coro, progress=None):
+    return _result(asyncio.run_coroutine_threadsafe(coro, get_loop()), progress)
+
+
+# Close an async generator once any step cancelled from the script thread has finished unwinding, since
+# `aclose` raises while the generator is still running (e.g., awaiting in a `finally`)
+async def _aclose(agen):
+    while agen.ag_running:
+        await asyncio.sleep(0)
+    await agen.aclose()
+
+
+# Drive an async generator from synchronous code (e.g., `st.write_stream`) one item at a time
+def iterate(agen, progress=None):
+    loop = get_loop()
+    try:
+        while True:
+            try:
+                yield _result(asyncio.run_coroutine_threadsafe(agen.__anext__(), loop), progress)
+            except StopAsyncIteration:
+                return
+    finally:
+        # Closing early (e.g., script stopped) still needs to release the stream's connection
+        asyncio.run_coroutine_threadsafe(_aclose(agen), loop).result()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import asdict, dataclass, field
+from statistics import quantiles
+from threading import Lock
+from typing import Dict, List, Optional
+
+from .config import config
+from .context import estimate_tokens
+
+# Percentiles reported for time to first token and inter-token latency
+PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class StreamMetrics:
+    provider: str
+    model: str
+    started_at: float
+    ttft: Optional[float] = None
+    duration: float = 0.0
+    chunks: int = 0
+    tokens: int = 0
+    error: Optional[str] = None
+    cached: bool = False
+    intervals: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        # Generation speed after the first token, so queueing and prompt processing don't count
+        if self.ttft is None or self.tokens < 2 or self.duration <= self.ttft:
+            return None
+        return (self.tokens - 1) / (self.duration - self.ttft)
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("intervals")
+        data["tokens_per_second"] = self.tokens_per_second
+        return data
+
+
+def percentiles(values: List[float]) -> Dict[int, Optional[float]]:
+    if not values:
+        return {p: None for p in PERCENTILES}
+    if len(values) == 1:
+        return {p: values[0] for p in PERCENTILES}
+    cuts = quantiles(values, n=100, method="inclusive")
+    return {p: cuts[p - 1] for p in PERCENTILES}
+
+
+# The last `window` streams of every session in the process, summarized per provider/model.
+# Every recorded stream is also appended to the JSONL log when `log_path` is set.
+class MetricsStore:
+    def __init__(self, window: int, log_path: Optional[str] = None):
+        self.log_path = log_path
+        self._samples = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record(self, metrics: StreamMetrics):
+        with self._lock:
+            self._samples.append(metrics)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(metrics.to_dict()) + "\n")
+
+    def samples(self) -> List[StreamMetrics]:
+        with self._lock:
+            return list(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self) -> List[dict]:
+        groups = {}
+        for sample in self.samples():
+            groups.setdefault((sample.provider, sample.model), []).append(sample)
+
+        rows = []
+        for (provider, model), samples in sorted(groups.items()):
+            # Cache hits replay stored text instantly, so they are counted but don't skew latency
+            live = [s for s in samples if not s.cached]
+            ok = [s for s in live if s.error is None]
+            errors = {}
+            for s in live:
+                if s.error is not None:
+                    errors[s.error] = errors.get(s.error, 0) + 1
+            speeds = [s.tokens_per_second for s in ok if s.tokens_per_second is not None]
+            rows.append(
+                {
+                    "provider": provider,
+                    "model": model,
+                    "requests": len(samples),
+                    "cached": len(samples) - len(live),
+                    "errors": errors,
+                    "ttft": percentiles([s.ttft for s in ok if s.ttft is not None]),
+                    "itl": percentiles([i for s in ok for i in s.intervals]),
+                    "duration": percentiles([s.duration for s in ok]),
+                    "tokens_per_second": sum(speeds) / len(speeds) if speeds else None,
+                    "tokens": sum(s.tokens for s in ok),
+                }
+            )
+        return rows
+
+    def jsonl(self) -> str:
+        return "".join(json.dumps(s.to_dict()) + "\n" for s in self.samples())
+
+    # https://prometheus.io/docs/instrumenting/exposition_formats/
+    def prometheus(self) -> str:
+        lines = [
+            "# HELP playground_requests Text generation streams in the rolling window.",
+            "# TYPE playground_requests gauge",
+        ]
+        rows = self.summary()
+        for row in rows:
+            labels = _labels(provider=row["provider"], model=row["model"])
+            lines.append(f"playground_requests{{{labels}}} {row['requests']}")
+
+        lines += [
+            "# HELP playground_errors Failed streams in the rolling window by error class.",
+            "# TYPE playground_errors gauge",
+        ]
+        for row in rows:
+            for error, count in sorted(row["errors"].items()):
+                labels = _labels(provider=row["provider"], model=row["model"], error=error)
+                lines.append(f"playground_errors{{{labels}}} {count}")
+
+        for name, key, help in [
+            ("playground_ttft_seconds", "ttft", "Time to first token."),
+            ("playground_inter_token_latency_seconds", "itl", "Time between streamed chunks."),
+            ("playground_stream_duration_seconds", "duration", "Total stream duration."),
+        ]:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} summary"]
+            for row in rows:
+                for p, value in row[key].items():
+                    if value is None:
+                        continue
+                    labels = _labels(provider=row["provider"], model=row["model"], quantile=p / 100)
+                    lines.append(f"{name}{{{labels}}} {value:.6f}")
+
+        lines += [
+            "# HELP playground_tokens_per_second Mean generation speed after the first token.",
+            "# TYPE playground_tokens_per_second gauge",
+        ]
+        for row in rows:
+            if row["tokens_per_second"] is not None:
+                labels = _labels(provider=row["provider"], model=row["model"])
+                lines.append(f"playground_tokens_per_second{{{labels}}} {row['tokens_per_second']:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+
+
+# Time a text stream as it is consumed. Tokens are estimated from the streamed text unless the provider
+# reports the real count in `usage`; intervals are measured between chunks, which is per token for
+# OpenAI-compatible APIs and per text delta for Anthropic.
+async def instrument(stream, provider, model, usage=None, cached=False):
+    if not config.metrics.enabled:
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+        return
+
+    metrics = StreamMetrics(provider=provider, model=model, started_at=time.time(), cached=cached)
+    start = last = time.perf_counter()
+    try:
+        async with aclosing(stream):
+            async for chunk in stream:
+                now = time.perf_counter()
+                if metrics.ttft is None:
+                    metrics.ttft = now - start
+                else:
+                    metrics.intervals.append(now - last)
+                last = now
+                metrics.chunks += 1
+                metrics.tokens += estimate_tokens(chunk)
+                yield chunk
+    except (GeneratorExit, asyncio.CancelledError):
+        # Stopped by the user or a rerun
+        metrics.error = "Cancelled"
+        raise
+    except BaseException as e:
+        metrics.error = type(e).__name__
+        raise
+    finally:
+        metrics.duration = time.perf_counter() - start
+        if usage and usage.get("output_tokens"):
+            metrics.tokens = usage["output_tokens"]
+        metrics_store.record(metrics)
+
+
+metrics_store = MetricsStore(config.metrics.window, log_path=config.metrics.log_path)
@@ -0,0 +1,120 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+from weakref import WeakKeyDictionary
+
+from .config import config
+from .retry import ProviderError
+
+if TYPE_CHECKING:
+    import httpx
+
+# Statuses that mean the result will never become ready
+# https://api.bfl.ml/docs
+BFL_FAILED_STATUSES = ["Error", "Content Moderated", "Request Moderated", "Task not found"]
+
+POLL_BACKOFF = 1.5
+
+_pollers = WeakKeyDictionary()
+
+
+@dataclass
+class PollJob:
+    client: "httpx.AsyncClient"
+    url: str
+    interval: float
+    max_interval: float
+    deadline: float
+    next_at: float
+    future: asyncio.Future
+    polling: bool = False
+
+
+# One background task per event loop polls every pending BFL result.
+# Each job starts with a short interval that backs off up to a per-model maximum, and is never polled past
+# its deadline.
+@dataclass
+class ResultPoller:
+    jobs: dict = field(default_factory=dict)
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    polls: set = field(default_factory=set)
+    task: Optional[asyncio.Task] = None
+
+    async def wait(self, client, url, interval_range, deadline):
+        loop = asyncio.get_running_loop()
+        interval, max_interval = interval_range
+        job = PollJob(
+            client=client,
+            url=url,
+            interval=interval,
+            max_interval=max_interval,
+            deadline=deadline,
+            next_at=loop.time() + interval,
+            future=loop.create_future(),
+        )
+        self.jobs[id(job)] = job
+
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.run())
+        self.wakeup.set()
+
+        try:
+            return await job.future
+        finally:
+            self.jobs.pop(id(job), None)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.jobs:
+            self.wakeup.clear()
+            now = loop.time()
+
+            for job in list(self.jobs.values()):
+                if job.future.done():
+                    continue
+                if job.next_at > job.deadline:
+                    job.future.set_exception(TimeoutError())
+                elif not job.polling and job.next_at <= now:
+                    job.polling = True
+                    task = loop.create_task(self.poll(job))
+                    self.polls.add(task)
+                    task.add_done_callback(self.polls.discard)
+
+            pending = [job.next_at for job in self.jobs.values() if not job.polling and not job.future.done()]
+            delay = max(min(pending) - now, 0) if pending else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def poll(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            timeout = min(config.timeout, max(job.deadline - loop.time(), 0.001))
+            response = await job.client.get(job.url, timeout=timeout)
+            if response.status_code // 100 != 2:
+                job.future.set_exception(ProviderError(response.status_code, response.text, response.headers))
+                return
+
+            result = response.json()
+            if result["status"] == "Ready":
+                job.future.set_result(result)
+            elif result["status"] in BFL_FAILED_STATUSES:
+                job.future.set_exception(ValueError(f"Error: {result['status']}"))
+            else:
+                job.interval = min(job.interval * POLL_BACKOFF, job.max_interval)
+                job.next_at = loop.time() + job.interval
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            job.polling = False
+            self.wakeup.set()
+
+
+def get_poller() -> ResultPoller:
+    loop = asyncio.get_running_loop()
+    poller = _pollers.get(loop)
+    if poller is None:
+        poller = _pollers[loop] = ResultPoller()
+    return poller
@@ -0,0 +1,217 @@
+import asyncio
+import random
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from .catalog import get_catalog
+from .clients import loaded_errors
+from .config import CircuitBreakerConfig, RetryConfig, config
+from .discovery import model_available
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+# A non-2xx response from an image provider
+class ProviderError(Exception):
+    def __init__(self, status: int, text: str, headers=None):
+        super().__init__(f"Error: {status} {text}")
+        self.status = status
+        self.headers = headers or {}
+
+
+# Raised instead of sending a request while a provider's breaker is open
+class CircuitOpenError(Exception):
+    def __init__(self, provider: str, retry_in: float):
+        provider_config = get_catalog().providers.get(provider)
+        name = provider_config.name if provider_config else provider
+        super().__init__(f"Error: {name} is failing, requests are paused for {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+def retry_policy(provider: str) -> RetryConfig:
+    return getattr(get_catalog().providers.get(provider), "retry", None) or config.retry
+
+
+# Closed: requests go through and consecutive failures are counted. Open: after `failures` in a row every
+# request fails fast for `reset_timeout` seconds. Half-open: then a single probe is let through, and its
+# outcome closes or re-opens the breaker. Shared by every session in the process.
+@dataclass
+class CircuitBreaker:
+    provider: str
+    settings: CircuitBreakerConfig
+    failures: int = 0
+    opened_at: Optional[float] = None
+    probing: bool = False
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.settings.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before_request(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self.probing:
+                self.probing = True
+                return
+            retry_in = max(self.opened_at + self.settings.reset_timeout - time.monotonic(), 1)
+            raise CircuitOpenError(self.provider, retry_in)
+
+    # The request was abandoned without an outcome; let another probe through
+    def release(self):
+        with self.lock:
+            self.probing = False
+
+    def record(self, ok: bool):
+        with self.lock:
+            self.probing = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.settings.failures:
+                self.opened_at = time.monotonic()
+
+
+# Settings changed in the catalog apply to the existing breaker, which keeps its state
+def get_breaker(provider: str) -> CircuitBreaker:
+    settings = (
+        getattr(get_catalog().providers.get(provider), "circuit_breaker", None) or config.circuit_breaker
+    )
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider, settings)
+        elif breaker.settings != settings:
+            with breaker.lock:
+                breaker.settings = settings
+        return breaker
+
+
+def breakers() -> Dict[str, CircuitBreaker]:
+    with _breakers_lock:
+        return dict(_breakers)
+
+
+# Seconds from `Retry-After` (seconds or an HTTP date), or from the `retry-after-ms` header OpenAI and
+# Anthropic send
+def retry_after(headers) -> Optional[float]:
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Whether an error is worth retrying (and counts against the breaker), and how long the provider asked
+# to wait
+def classify(error: BaseException, policy: RetryConfig) -> Tuple[bool, Optional[float]]:
+    if isinstance(error, ProviderError):
+        return error.status in policy.statuses, retry_after(error.headers)
+    if isinstance(error, loaded_errors("APIStatusError")):
+        return error.status_code in policy.statuses, retry_after(error.response.headers)
+    connection_errors = loaded_errors("APIConnectionError") + loaded_errors("TransportError", ("httpx",))
+    if isinstance(error, connection_errors):
+        return True, None
+    return False, None
+
+
+# Exponential backoff with full jitter, or the provider's Retry-After when it sent one
+def backoff(policy: RetryConfig, attempt: int, after: Optional[float] = None) -> float:
+    if after is not None:
+        return min(after, policy.max_retry_after)
+    return random.uniform(0, min(policy.max_backoff, policy.backoff * 2**attempt))
+
+
+# Call `request` until it succeeds, the error isn't retryable, attempts run out, or the next wait would go
+# past `deadline` (loop time). Every attempt goes through the provider's circuit breaker.
+async def with_retries(provider: str, request, deadline: Optional[float] = None):
+    loop = asyncio.get_running_loop()
+    policy = retry_policy(provider)
+    breaker = get_breaker(provider)
+
+    for attempt in range(policy.attempts):
+        breaker.before_request()
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            retryable, after = classify(e, policy)
+            breaker.record(not retryable)
+            if not retryable or attempt == policy.attempts - 1:
+                raise
+            delay = backoff(policy, attempt, after)
+            if deadline is not None and loop.time() + delay >= deadline:
+                raise
+            await asyncio.sleep(delay)
+        else:
+            breaker.record(True)
+            return result
+
+
+# Retry opening a stream until its first chunk arrives; once text has been shown it can't be taken back
+async def retry_stream(provider: str, open_stream):
+    async def first_chunk():
+        stream = open_stream()
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+        except BaseException:
+            await stream.aclose()
+            raise
+
+    stream, chunk = await with_retries(provider, first_chunk)
+    async with aclosing(stream):
+        if chunk is None:
+            return
+        yield chunk
+        async for chunk in stream:
+            yield chunk
+
+
+# Worth trying the fallback model: the provider is down, overloaded, or its breaker is open
+def should_fail_over(error: BaseException, provider: str) -> bool:
+    return isinstance(error, CircuitOpenError) or classify(error, retry_policy(provider))[0]
+
+
+# The fallback configured for a model, if failover is on, the fallback provider has an API key, and it still
+# lists the fallback model
+def fallback_backend(
+    kind: str, provider: str, model: str, api_keys: Dict[str, str]
+) -> Optional[Tuple[str, str]]:
+    current = get_catalog()
+    fallback = getattr(current.model(kind, provider, model), "fallback", None)
+    if not config.failover or not fallback:
+        return None
+    fallback_provider, fallback_model = fallback
+    provider_config = current.providers.get(fallback_provider)
+    if current.model(kind, fallback_provider, fallback_model) is None:
+        return None
+    if not (api_keys.get(fallback_provider) or provider_config.api_key):
+        return None
+    if model_available(fallback_provider, fallback_model) is False:
+        return None
+    return fallback
@@ -1,20 +1,135 @@
 import mimetypes
 from base64 import b64decode, b64encode
+from collections import OrderedDict
+from hashlib import sha256
 from io import BytesIO
+from threading import Lock
+from typing import Optional, Tuple
 
-from PIL import Image
+from PIL import Image, ImageOps
 
+from .config import IMAGE_SIZE_DIMENSIONS, config
 
-def base64_decode_image_data_url(data_url: str) -> Image:
+
+def base64_decode_data_url(data_url: str) -> bytes:
     _, data = data_url.split("base64,", maxsplit=1)
-    byte_data = b64decode(data)
-    return Image.open(BytesIO(byte_data))
+    return b64decode(data)
+
+
+def base64_decode_image_data_url(data_url: str) -> Image:
+    return Image.open(BytesIO(base64_decode_data_url(data_url)))
+
+
+# Encoded uploads by (content digest, target size), so reruns don't re-read and re-encode the same file
+_encoded_uploads = OrderedDict()
+_encoded_uploads_size = 0
+_encoded_uploads_lock = Lock()
+
+
+# Output dimensions implied by generation parameters, if any
+def target_image_size(parameters: dict) -> Optional[Tuple[int, int]]:
+    if parameters.get("image_size") in IMAGE_SIZE_DIMENSIONS:
+        return IMAGE_SIZE_DIMENSIONS[parameters["image_size"]]
+    if parameters.get("width") and parameters.get("height"):
+        return parameters["width"], parameters["height"]
+    if parameters.get("aspect_ratio"):
+        width, height = parameters["aspect_ratio"].split("x")
+        return int(width), int(height)
+    return None
+
+
+# Shrink an image to cover `size` (width, height) and center-crop it to that size before it's uploaded, since
+# the model will resize it anyway. EXIF orientation is applied first, as the re-encoded image has no EXIF.
+# JPEG is used unless the image has transparency. Images that would need upscaling keep their original bytes.
+def downscale_image(file_data: bytes, size: Tuple[int, int]) -> Tuple[bytes, Optional[str]]:
+    image = ImageOps.exif_transpose(Image.open(BytesIO(file_data)))
+    if image.width <= size[0] or image.height <= size[1]:
+        return file_data, None
+
+    image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    output = BytesIO()
+    if image.mode in ["RGBA", "LA", "P"]:
+        image.save(output, format="PNG", optimize=True)
+        return output.getvalue(), "image/png"
+    image.convert("RGB").save(output, format="JPEG", quality=config.upload_quality)
+    return output.getvalue(), "image/jpeg"
 
 
-def base64_encode_image_file(image_file: BytesIO) -> str:
+def base64_encode_image_file(image_file: BytesIO, size: Optional[Tuple[int, int]] = None) -> str:
+    global _encoded_uploads_size
+
+    file_data = image_file.getvalue()
+    key = (sha256(file_data).hexdigest(), size)
+    with _encoded_uploads_lock:
+        if key in _encoded_uploads:
+            _encoded_uploads.move_to_end(key)
+            return _encoded_uploads[key]
+
     file_type = image_file.type
     if not file_type:
         file_type = mimetypes.guess_type(image_file.name)[0]
-    file_data = image_file.read()
+    if size:
+        file_data, resized_type = downscale_image(file_data, size)
+        file_type = resized_type or file_type
     b64 = b64encode(file_data).decode("utf-8")
-    return f"data:{file_type};base64,{b64}"
+    data_url = f"data:{file_type};base64,{b64}"
+
+    with _encoded_uploads_lock:
+        _encoded_uploads_size += len(data_url) - len(_encoded_uploads.pop(key, ""))
+        _encoded_uploads[key] = data_url
+        while _encoded_uploads_size > config.upload_cache_bytes and len(_encoded_uploads) > 1:
+            _, old_data_url = _encoded_uploads.popitem(last=False)
+            _encoded_uploads_size -= len(old_data_url)
+    return data_url
+
+
+# Decodes the first base64 data URL in a streamed JSON body (fal sync mode) as chunks arrive.
+# Only the undecoded tail of the current chunk is buffered, so the JSON text, the URL string, and the
+# decoded bytes are never held at the same time. Decoded bytes go into a `BytesIO`, whose `getvalue` returns
+# them without a final copy. If the body has no data URL it is kept whole in `text`.
+class Base64DataURLDecoder:
+    def __init__(self):
+        self.mime_type = None
+        self.done = False
+        self._pending = bytearray()
+        self._data = BytesIO()
+
+    def feed(self, chunk: bytes):
+        if self.done:
+            return
+        self._pending += chunk
+
+        if self.mime_type is None:
+            # A quote preceded by a backslash is inside some other JSON string
+            start = self._pending.find(b'"data:')
+            while start > 0 and self._pending[start - 1] == ord("\\"):
+                start = self._pending.find(b'"data:', start + 1)
+            marker = self._pending.find(b";base64,", start) if start >= 0 else -1
+            if marker < 0:
+                return
+            self.mime_type = self._pending[start + 6 : marker].decode("utf-8").replace("\\/", "/")
+            del self._pending[: marker + 8]
+
+        # Base64 never contains backslashes or quotes, so dropping backslashes undoes JSON's `\/` escaping
+        # and the next quote ends the URL
+        end = self._pending.find(b'"')
+        if end >= 0:
+            del self._pending[end:]
+            self.done = True
+        self._pending = self._pending.replace(b"\\", b"")
+
+        # Decode whole 4-character groups and keep the rest for the next chunk
+        size = len(self._pending) if self.done else len(self._pending) // 4 * 4
+        self._data.write(b64decode(self._pending[:size]))
+        del self._pending[:size]
+
+    @property
+    def size(self) -> int:
+        return self._data.tell()
+
+    @property
+    def text(self) -> str:
+        return self._pending.decode("utf-8") if self.mime_type is None else ""
+
+    def close(self):
+        return self._data.getvalue() if self.done else None
@@ -2,24 +2,20 @@ from datetime import datetime
 
 import streamlit as st
 
-from lib import config, txt2txt_generate
+from lib import config, fit_context, txt2txt_generate, visible_providers
 
 st.set_page_config(
     page_title=f"Text Generation - {config.title}",
     layout=config.layout,
 )
 
-if "api_key_anthropic" not in st.session_state:
-    st.session_state.api_key_anthropic = ""
+# Providers and models come from the catalog file, which can change while the app runs; each run uses the
+# catalog current when it started, less any models their provider no longer lists
+text_providers = visible_providers("text")
 
-if "api_key_hf" not in st.session_state:
-    st.session_state.api_key_hf = ""
-
-if "api_key_openai" not in st.session_state:
-    st.session_state.api_key_openai = ""
-
-if "api_key_pplx" not in st.session_state:
-    st.session_state.api_key_pplx = ""
+for provider_id in text_providers:
+    if f"api_key_{provider_id}" not in st.session_state:
+        st.session_state[f"api_key_{provider_id}"] = ""
 
 if "running" not in st.session_state:
     st.session_state.running = False
@@ -30,162 +26,212 @@ if "txt2txt_messages" not in st.session_state:
 if "txt2txt_seed" not in st.session_state:
     st.session_state.txt2txt_seed = 0
 
+if "txt2txt_history_turns" not in st.session_state:
+    st.session_state.txt2txt_history_turns = config.history_turns
+
 st.logo(config.logo, size="small")
-st.sidebar.header("Settings")
-
-text_providers = {
-    provider_id: provider_config
-    for provider_id, provider_config in config.providers.items()
-    if getattr(provider_config, "text", None)
-}
-
-provider = st.sidebar.selectbox(
-    "Provider",
-    options=text_providers.keys(),
-    format_func=lambda x: text_providers[x].name,
-    disabled=st.session_state.running,
-)
 
-# Show the API key input for the selected provider.
-for provider_id, provider_preset in text_providers.items():
-    if provider == provider_id:
-        session_key = f"api_key_{provider}"
-        api_key = provider_preset.api_key
-        st.session_state[session_key] = st.sidebar.text_input(
-            "API Key",
-            type="password",
-            value="" if api_key else st.session_state[session_key],
-            disabled=bool(api_key) or st.session_state.running,
-            help="Set by environment variable" if api_key else "Cleared on page refresh",
+
+# The sidebar reruns on its own when a setting changes; full runs (e.g., a new prompt) get its values
+@st.fragment
+def settings():
+    st.header("Settings")
+
+    provider = st.selectbox(
+        "Provider",
+        options=text_providers.keys(),
+        format_func=lambda x: text_providers[x].name,
+        disabled=st.session_state.running,
+    )
+
+    # Show the API key input for the selected provider.
+    for provider_id, provider_preset in text_providers.items():
+        if provider == provider_id:
+            session_key = f"api_key_{provider}"
+            api_key = provider_preset.api_key
+            st.session_state[session_key] = st.text_input(
+                "API Key",
+                type="password",
+                value="" if api_key else st.session_state[session_key],
+                disabled=bool(api_key) or st.session_state.running,
+                help="Set by environment variable" if api_key else "Cleared on page refresh",
+            )
+
+    provider_config = text_providers[provider]
+
+    model = st.selectbox(
+        "Model",
+        options=provider_config.text.keys(),
+        format_func=lambda x: provider_config.text[x].name,
+        disabled=st.session_state.running,
+    )
+
+    model_config = provider_config.text[model]
+
+    system = st.text_area(
+        "System Message",
+        value=model_config.system_prompt,
+        disabled=st.session_state.running,
+    )
+
+    # Build parameters from preset by rendering the appropriate input widgets
+    parameters = {"model": model}
+    for param in model_config.parameters:
+        if param == "max_tokens":
+            parameters[param] = st.slider(
+                "Max Tokens",
+                step=512,
+                value=model_config.max_tokens,
+                min_value=model_config.max_tokens_range[0],
+                max_value=model_config.max_tokens_range[1],
+                disabled=st.session_state.running,
+                help="Maximum number of tokens to generate (default: 512)",
+            )
+
+        if param == "temperature":
+            parameters[param] = st.slider(
+                "Temperature",
+                step=0.1,
+                value=model_config.temperature,
+                min_value=model_config.temperature_range[0],
+                max_value=model_config.temperature_range[1],
+                disabled=st.session_state.running,
+                help="Used to modulate the next token probabilities (default: 1.0)",
+            )
+
+        if param == "frequency_penalty":
+            parameters[param] = st.slider(
+                "Frequency Penalty",
+                step=0.1,
+                value=model_config.frequency_penalty,
+                min_value=model_config.frequency_penalty_range[0],
+                max_value=model_config.frequency_penalty_range[1],
+                disabled=st.session_state.running,
+                help="Penalize new tokens based on their existing frequency in the text (default: 0.0)",
+            )
+
+        if param == "presence_penalty":
+            parameters[param] = st.slider(
+                "Presence Penalty",
+                step=0.1,
+                value=model_config.presence_penalty,
+                min_value=model_config.presence_penalty_range[0],
+                max_value=model_config.presence_penalty_range[1],
+                disabled=st.session_state.running,
+                help="Penalize new tokens based on their presence in the text so far (default: 0.0)",
+            )
+
+        if param == "seed":
+            parameters[param] = st.number_input(
+                "Seed",
+                value=-1,
+                min_value=-1,
+                max_value=(1 << 53) - 1,
+                disabled=st.session_state.running,
+                help="Make a best effort to sample deterministically (default: -1)",
+            )
+
+    return provider, model_config, system, parameters
+
+
+# Prompt cache usage reported by the provider (Anthropic)
+def cache_caption(usage):
+    read = usage.get("cache_read_input_tokens") or 0
+    written = usage.get("cache_creation_input_tokens") or 0
+    if read or written:
+        st.caption(f"Prompt cache: {read:,} tokens read, {written:,} tokens written")
+
+
+# Earlier turns left out of the request to fit the context budget
+def context_caption(context):
+    if context is not None and context.dropped_messages:
+        st.caption(
+            f"Left out {context.dropped_messages} earlier messages (~{context.saved_tokens:,} tokens) "
+            f"to fit the {context.budget:,} token context budget"
         )
 
-provider_config = text_providers[provider]
 
-model = st.sidebar.selectbox(
-    "Model",
-    options=provider_config.text.keys(),
-    format_func=lambda x: provider_config.text[x].name,
-    disabled=st.session_state.running,
-)
+def show_earlier():
+    st.session_state.txt2txt_history_turns += config.history_turns
 
-model_config = provider_config.text[model]
 
-system = st.sidebar.text_area(
-    "System Message",
-    value=model_config.system_prompt,
-    disabled=st.session_state.running,
-)
+def delete_last():
+    if len(st.session_state.txt2txt_messages) >= 2:
+        st.session_state.txt2txt_messages.pop()
+        st.session_state.txt2txt_messages.pop()
 
-st.html("""
-    <h1>Text Generation</h1>
-    <p>Chat with large language models.</p>
-""")
-
-# Build parameters from preset by rendering the appropriate input widgets
-parameters = {"model": model}
-for param in model_config.parameters:
-    if param == "max_tokens":
-        parameters[param] = st.sidebar.slider(
-            "Max Tokens",
-            step=512,
-            value=model_config.max_tokens,
-            min_value=model_config.max_tokens_range[0],
-            max_value=model_config.max_tokens_range[1],
-            disabled=st.session_state.running,
-            help="Maximum number of tokens to generate (default: 512)",
-        )
 
-    if param == "temperature":
-        parameters[param] = st.sidebar.slider(
-            "Temperature",
-            step=0.1,
-            value=model_config.temperature,
-            min_value=model_config.temperature_range[0],
-            max_value=model_config.temperature_range[1],
+def clear_all():
+    st.session_state.txt2txt_messages = []
+    st.session_state.txt2txt_history_turns = config.history_turns
+
+
+# History reruns on its own for its buttons (their callbacks update it first), without re-running the sidebar
+@st.fragment
+def history():
+    # Only the most recent turns are rendered; older ones are loaded on request
+    hidden = max(len(st.session_state.txt2txt_messages) - st.session_state.txt2txt_history_turns * 2, 0)
+    if hidden:
+        st.button(
+            f"Show earlier messages ({hidden // 2} hidden)",
+            on_click=show_earlier,
             disabled=st.session_state.running,
-            help="Used to modulate the next token probabilities (default: 1.0)",
         )
 
-    if param == "frequency_penalty":
-        parameters[param] = st.sidebar.slider(
-            "Frequency Penalty",
-            step=0.1,
-            value=model_config.frequency_penalty,
-            min_value=model_config.frequency_penalty_range[0],
-            max_value=model_config.frequency_penalty_range[1],
-            disabled=st.session_state.running,
-            help="Penalize new tokens based on their existing frequency in the text (default: 0.0)",
-        )
+    # Chat messages
+    for message in st.session_state.txt2txt_messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            cache_caption(message.get("usage", {}))
+            context_caption(message.get("context"))
+
+    # Buttons for deleting last message or clearing all messages, hidden while a response is streaming
+    if st.session_state.txt2txt_messages and not st.session_state.running:
+        button_container = st.empty()
+        with button_container.container():
+            # https://discuss.streamlit.io/t/st-button-in-one-line/25966/6
+            st.html("""
+            <style>
+                div[data-testid="column"] {
+                    width: fit-content;
+                    min-width: 0;
+                    flex: none;
+                }
+            </style>
+            """)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("❌", help="Delete last message", on_click=delete_last)
+            with col2:
+                st.button("🗑️", help="Clear all messages", on_click=clear_all)
+
+
+with st.sidebar:
+    provider, model_config, system, parameters = settings()
 
-    if param == "presence_penalty":
-        parameters[param] = st.sidebar.slider(
-            "Presence Penalty",
-            step=0.1,
-            value=model_config.presence_penalty,
-            min_value=model_config.presence_penalty_range[0],
-            max_value=model_config.presence_penalty_range[1],
-            disabled=st.session_state.running,
-            help="Penalize new tokens based on their presence in the text so far (default: 0.0)",
-        )
-
-    if param == "seed":
-        parameters[param] = st.sidebar.number_input(
-            "Seed",
-            value=-1,
-            min_value=-1,
-            max_value=(1 << 53) - 1,
-            disabled=st.session_state.running,
-            help="Make a best effort to sample deterministically (default: -1)",
-        )
+st.html("""
+    <h1>Text Generation</h1>
+    <p>Chat with large language models.</p>
+""")
 
-# Chat messages
-for message in st.session_state.txt2txt_messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-
-# Buttons for deleting last message or clearing all messages
-if st.session_state.txt2txt_messages:
-    button_container = st.empty()
-    with button_container.container():
-        # https://discuss.streamlit.io/t/st-button-in-one-line/25966/6
-        st.html("""
-        <style>
-            div[data-testid="column"] {
-                width: fit-content;
-                min-width: 0;
-                flex: none;
-            }
-        </style>
-        """)
-
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("❌", help="Delete last message") and len(st.session_state.txt2txt_messages) >= 2:
-                st.session_state.txt2txt_messages.pop()
-                st.session_state.txt2txt_messages.pop()
-                st.rerun()
-        with col2:
-            if st.button("🗑️", help="Clear all messages"):
-                st.session_state.txt2txt_messages = []
-                st.rerun()
-else:
-    button_container = None
+history()
 
 # Chat input
 if prompt := st.chat_input(
     "What would you like to know?",
     on_submit=lambda: setattr(st.session_state, "running", True),
 ):
-    if "seed" in parameters and parameters["seed"] >= 0:
+    # Temperature 0 or a pinned seed makes the request deterministic, so it can use the completion cache
+    pinned = "seed" in parameters and parameters["seed"] >= 0
+    cache = pinned or parameters.get("temperature") == 0
+    if pinned:
         st.session_state.txt2txt_seed = parameters["seed"]
     else:
         st.session_state.txt2txt_seed = int(datetime.now().timestamp() * 1e6) % (1 << 53)
         if "seed" in parameters:
             parameters["seed"] = st.session_state.txt2txt_seed
 
-    if button_container:
-        button_container.empty()
-
     if provider == "anthropic":
         messages = []
         parameters["system"] = system
@@ -194,6 +240,11 @@ if prompt := st.chat_input(
 
     messages.extend([{"role": m["role"], "content": m["content"]} for m in st.session_state.txt2txt_messages])
     messages.append({"role": "user", "content": prompt})
+
+    # Drop the oldest turns that don't fit the context budget
+    messages, context = fit_context(
+        messages, model_config, parameters.get("max_tokens"), parameters.get("system")
+    )
     parameters["messages"] = messages
 
     with st.chat_message("user"):
@@ -202,9 +253,16 @@ if prompt := st.chat_input(
     with st.chat_message("assistant"):
         session_key = f"api_key_{provider}"
         api_key = st.session_state[session_key] or text_providers[provider].api_key
-        response = txt2txt_generate(api_key, provider, parameters)
+        usage = {}
+        # Keys for equivalent backends a slow or failing request can be hedged or failed over to
+        api_keys = {p: st.session_state[f"api_key_{p}"] or c.api_key for p, c in text_providers.items()}
+        response = txt2txt_generate(api_key, provider, parameters, cache, usage, api_keys)
+        cache_caption(usage)
+        context_caption(context)
         st.session_state.running = False
 
     st.session_state.txt2txt_messages.append({"role": "user", "content": prompt})
-    st.session_state.txt2txt_messages.append({"role": "assistant", "content": response})
+    st.session_state.txt2txt_messages.append(
+        {"role": "assistant", "content": response, "usage": usage, "context": context}
+    )
     st.rerun()
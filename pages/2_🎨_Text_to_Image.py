@@ -1,28 +1,41 @@
+from contextlib import aclosing
 from datetime import datetime
 
 import streamlit as st
 
-from lib import base64_encode_image_file, config, txt2img_generate
+from lib import (
+    BATCH,
+    INTERACTIVE,
+    StoredImage,
+    base64_encode_image_file,
+    cancel_job,
+    config,
+    enforce_image_budget,
+    job_position,
+    pop_job,
+    queue_message,
+    session_id,
+    session_jobs,
+    submit_job,
+    target_image_size,
+    txt2img_batch_async,
+    txt2img_failover_async,
+    txt2img_hedged_async,
+    visible_providers,
+)
 
 st.set_page_config(
     page_title=f"Text to Image - {config.title}",
     layout=config.layout,
 )
 
-if "api_key_bfl" not in st.session_state:
-    st.session_state.api_key_bfl = ""
-
-if "api_key_fal" not in st.session_state:
-    st.session_state.api_key_fal = ""
-
-if "api_key_hf" not in st.session_state:
-    st.session_state.api_key_hf = ""
-
-if "api_key_together" not in st.session_state:
-    st.session_state.api_key_together = ""
+# Providers and models come from the catalog file, which can change while the app runs; each run uses the
+# catalog current when it started, less any models their provider no longer lists
+image_providers = visible_providers("image")
 
-if "running" not in st.session_state:
-    st.session_state.running = False
+for provider_id in image_providers:
+    if f"api_key_{provider_id}" not in st.session_state:
+        st.session_state[f"api_key_{provider_id}"] = ""
 
 if "txt2img_messages" not in st.session_state:
     st.session_state.txt2img_messages = []
@@ -30,263 +43,471 @@ if "txt2img_messages" not in st.session_state:
 if "txt2img_seed" not in st.session_state:
     st.session_state.txt2img_seed = 0
 
-st.logo(config.logo, size="small")
-st.sidebar.header("Settings")
-
-image_providers = {
-    provider_id: provider_config
-    for provider_id, provider_config in config.providers.items()
-    if getattr(provider_config, "image", None)
-}
-
-provider = st.sidebar.selectbox(
-    "Provider",
-    options=image_providers.keys(),
-    format_func=lambda x: image_providers[x].name,
-    disabled=st.session_state.running,
-)
+if "txt2img_history_turns" not in st.session_state:
+    st.session_state.txt2img_history_turns = config.history_turns
+
+# Generations run as background jobs stored under an ID kept in the URL, so they survive a refresh. The ID
+# changes each time a new tab takes the jobs over, and never while the tab holding them is connected.
+session = session_id()
+
+# Finished jobs (including ones started before a refresh) move into the history
+for job in session_jobs(session, "txt2img"):
+    if job.done:
+        if job.status != "cancelled":
+            st.session_state.txt2img_messages.append(job.request["message"])
+            st.session_state.txt2img_messages.append({"role": "assistant", "content": job.result})
+        pop_job(job)
+enforce_image_budget(st.session_state.txt2img_messages)
+
+
+# Evenly spaced values across a parameter's range for the batch grid (always includes the default)
+def grid_options(value, value_range, step):
+    low, high = value_range
+    # Rounded before deduplicating, so the default can't sit next to a value that only differs by float error
+    options = {round(round((low + i * (high - low) / 6) / step) * step, 2) for i in range(7)}
+    return sorted(options | {round(value, 2)})
+
+
+# Images are kept encoded, so PNG and JPEG bytes go to the browser as-is without decoding pixels
+def render_image(content):
+    if isinstance(content, StoredImage):
+        data = content.read()
+        if data is None:
+            st.caption("Image is no longer available")
+        else:
+            st.image(data, output_format=content.format if content.format in ["PNG", "JPEG"] else "auto")
+    else:
+        st.write(content)  # success will be image, error will be text
 
-# Show the API key input for the selected provider.
-for provider_id, provider_config in image_providers.items():
-    if provider == provider_id:
-        session_key = f"api_key_{provider}"
-        api_key = provider_config.api_key
-        st.session_state[session_key] = st.sidebar.text_input(
-            "API Key",
-            type="password",
-            value="" if api_key else st.session_state[session_key],
-            disabled=bool(api_key) or st.session_state.running,
-            help="Set by environment variable" if api_key else "Cleared on page refresh",
-        )
 
-provider_config = image_providers[provider]
+# Show finished batch results side by side, four per row
+def render_grid(results):
+    columns = st.columns(min(len(results), 4))
+    for i, result in enumerate(results):
+        with columns[i % 4]:
+            render_image(result["content"])
+            st.caption(result["caption"])
 
-model = st.sidebar.selectbox(
-    "Model",
-    options=provider_config.image.keys(),
-    format_func=lambda x: provider_config.image[x].name,
-    disabled=st.session_state.running,
-)
 
-model_config = provider_config.image[model]
+# A job that hasn't finished: its prompt, then where it is in line or the batch results so far
+def render_job(job):
+    with st.chat_message("user"):
+        st.markdown(job.request["message"]["content"])
 
-st.html("""
-    <h1>Text to Image</h1>
-    <p>Generate an image from a text prompt.</p>
-""")
+    with st.chat_message("assistant"):
+        captions = job.request["captions"]
+        if captions:
+            columns = st.columns(min(len(captions), 4))
+            for i, caption in enumerate(captions):
+                with columns[i % 4]:
+                    if i in job.partial:
+                        render_image(job.partial[i])
+                        st.caption(caption)
+                    else:
+                        st.caption("Running...")
+        elif job.status == "queued":
+            ahead = job_position(job)
+            st.caption(f"Queued, {ahead} ahead" if ahead else "Queued")
+        else:
+            st.caption(queue_message(job.queue) or "Running...")
+
+        if st.button("⏹️", key=f"cancel_{job.id}", help="Cancel generation"):
+            cancel_job(job)
+            st.rerun()
+
+
+# Unfinished jobs are polled without rerunning the rest of the page; when one finishes the whole page reruns
+# to move it into the history
+@st.fragment(run_every=config.jobs.poll_interval)
+def render_jobs():
+    jobs = session_jobs(session, "txt2img")
+    if any(job.done for job in jobs):
+        st.rerun()
+    for job in jobs:
+        render_job(job)
 
-# Build parameters from preset by rendering the appropriate input widgets
-parameters = {}
-for param in model_config.parameters:
-    if param == "model":
-        parameters[param] = model
-
-    if param == "seed":
-        parameters[param] = st.sidebar.number_input(
-            "Seed",
-            min_value=-1,
-            max_value=(1 << 53) - 1,
-            value=-1,
-            disabled=st.session_state.running,
-        )
 
-    if param == "negative_prompt":
-        parameters[param] = st.sidebar.text_area(
-            "Negative Prompt",
-            value=model_config.negative_prompt,
-            disabled=st.session_state.running,
-        )
+st.logo(config.logo, size="small")
 
-    if param == "width":
-        parameters[param] = st.sidebar.slider(
-            "Width",
-            step=64,
-            value=model_config.width,
-            min_value=model_config.width_range[0],
-            max_value=model_config.width_range[1],
-            disabled=st.session_state.running,
-        )
 
-    if param == "height":
-        parameters[param] = st.sidebar.slider(
-            "Height",
-            step=64,
-            value=model_config.height,
-            min_value=model_config.height_range[0],
-            max_value=model_config.height_range[1],
-            disabled=st.session_state.running,
-        )
+# The sidebar reruns on its own when a setting changes; full runs (e.g., a new prompt) get its values
+@st.fragment
+def settings():
+    st.header("Settings")
 
-    if param == "image_size":
-        parameters[param] = st.sidebar.select_slider(
-            "Image Size",
-            options=model_config.image_sizes,
-            value=model_config.image_size,
-            disabled=st.session_state.running,
-        )
+    provider = st.selectbox(
+        "Provider",
+        options=image_providers.keys(),
+        format_func=lambda x: image_providers[x].name,
+    )
 
-    if param == "aspect_ratio":
-        parameters[param] = st.sidebar.select_slider(
-            "Aspect Ratio",
-            options=model_config.aspect_ratios,
-            value=model_config.aspect_ratio,
-            disabled=st.session_state.running,
-        )
+    # Show the API key input for the selected provider.
+    for provider_id, provider_config in image_providers.items():
+        if provider == provider_id:
+            session_key = f"api_key_{provider}"
+            api_key = provider_config.api_key
+            st.session_state[session_key] = st.text_input(
+                "API Key",
+                type="password",
+                value="" if api_key else st.session_state[session_key],
+                disabled=bool(api_key),
+                help="Set by environment variable" if api_key else "Cleared on page refresh",
+            )
+
+    provider_config = image_providers[provider]
+
+    model = st.selectbox(
+        "Model",
+        options=provider_config.image.keys(),
+        format_func=lambda x: provider_config.image[x].name,
+    )
 
-    if param in ["guidance_scale", "guidance"]:
-        parameters[param] = st.sidebar.slider(
-            "Guidance Scale",
-            model_config.guidance_scale_range[0],
-            model_config.guidance_scale_range[1],
-            model_config.guidance_scale,
-            0.1,
-            disabled=st.session_state.running,
+    model_config = provider_config.image[model]
+
+    # Build parameters from preset by rendering the appropriate input widgets
+    parameters = {}
+    for param in model_config.parameters:
+        if param == "model":
+            parameters[param] = model
+
+        if param == "seed":
+            parameters[param] = st.number_input(
+                "Seed",
+                min_value=-1,
+                max_value=(1 << 53) - 1,
+                value=-1,
+            )
+
+        if param == "negative_prompt":
+            parameters[param] = st.text_area(
+                "Negative Prompt",
+                value=model_config.negative_prompt,
+            )
+
+        if param == "width":
+            parameters[param] = st.slider(
+                "Width",
+                step=64,
+                value=model_config.width,
+                min_value=model_config.width_range[0],
+                max_value=model_config.width_range[1],
+            )
+
+        if param == "height":
+            parameters[param] = st.slider(
+                "Height",
+                step=64,
+                value=model_config.height,
+                min_value=model_config.height_range[0],
+                max_value=model_config.height_range[1],
+            )
+
+        if param == "image_size":
+            parameters[param] = st.select_slider(
+                "Image Size",
+                options=model_config.image_sizes,
+                value=model_config.image_size,
+            )
+
+        if param == "aspect_ratio":
+            parameters[param] = st.select_slider(
+                "Aspect Ratio",
+                options=model_config.aspect_ratios,
+                value=model_config.aspect_ratio,
+            )
+
+        if param in ["guidance_scale", "guidance"]:
+            parameters[param] = st.slider(
+                "Guidance Scale",
+                model_config.guidance_scale_range[0],
+                model_config.guidance_scale_range[1],
+                model_config.guidance_scale,
+                0.1,
+            )
+
+        if param in ["num_inference_steps", "steps"]:
+            parameters[param] = st.slider(
+                "Inference Steps",
+                model_config.num_inference_steps_range[0],
+                model_config.num_inference_steps_range[1],
+                model_config.num_inference_steps,
+                1,
+            )
+
+        if param == "strength":
+            parameters[param] = st.slider(
+                "Strength",
+                model_config.strength_range[0],
+                model_config.strength_range[1],
+                model_config.strength,
+                0.05,
+            )
+
+        if param in ["expand_prompt", "prompt_expansion"]:
+            parameters[param] = st.checkbox(
+                "Prompt Expansion",
+                value=False,
+            )
+
+        if param == "prompt_upsampling":
+            parameters[param] = st.checkbox(
+                "Prompt Upsampling",
+                value=False,
+            )
+
+        if param == "image_url":
+            image_file = st.file_uploader(
+                "Image",
+                type=["bmp", "gif", "jpg", "jpeg", "png", "webp"],
+                accept_multiple_files=False,
+            )
+
+    # Encode the upload after the loop so it can be shrunk to the output size chosen above
+    if "image_url" in model_config.parameters and image_file:
+        size = target_image_size(parameters) if config.upload_resize else None
+        parameters["image_url"] = base64_encode_image_file(image_file, size)
+
+    # Batch mode runs several seeds and/or a grid of guidance and step values for the same prompt
+    guidance_param = next((p for p in model_config.parameters if p in ["guidance_scale", "guidance"]), None)
+    steps_param = next((p for p in model_config.parameters if p in ["num_inference_steps", "steps"]), None)
+    guidance_values = []
+    steps_values = []
+
+    with st.expander("Batch"):
+        batch_size = st.number_input(
+            "Images",
+            min_value=1,
+            max_value=config.batch_max_images,
+            value=1,
+            help="Number of seeds to run for each guidance and steps combination (default: 1)",
         )
 
-    if param in ["num_inference_steps", "steps"]:
-        parameters[param] = st.sidebar.slider(
-            "Inference Steps",
-            model_config.num_inference_steps_range[0],
-            model_config.num_inference_steps_range[1],
-            model_config.num_inference_steps,
-            1,
-            disabled=st.session_state.running,
+        if guidance_param:
+            guidance_values = st.multiselect(
+                "Guidance Scale Grid",
+                options=grid_options(model_config.guidance_scale, model_config.guidance_scale_range, 0.1),
+                help="Run the prompt once per value instead of the sidebar setting",
+            )
+
+        if steps_param:
+            steps_values = st.multiselect(
+                "Inference Steps Grid",
+                options=grid_options(
+                    model_config.num_inference_steps, model_config.num_inference_steps_range, 1
+                ),
+                help="Run the prompt once per value instead of the sidebar setting",
+            )
+
+        batch_concurrency = st.slider(
+            "Concurrency",
+            min_value=1,
+            max_value=config.batch_max_concurrency,
+            value=config.batch_max_concurrency,
+            help="Maximum number of requests in flight at once",
         )
 
-    if param == "strength":
-        parameters[param] = st.sidebar.slider(
-            "Strength",
-            model_config.strength_range[0],
-            model_config.strength_range[1],
-            model_config.strength,
-            0.05,
-            disabled=st.session_state.running,
+    # Outside the expander so it's seen even when the expander is closed
+    variation_count = batch_size * max(len(guidance_values), 1) * max(len(steps_values), 1)
+    if variation_count > config.batch_max_images:
+        st.warning(
+            f"The batch has {variation_count} variations; only the first {config.batch_max_images} will be "
+            f"generated ({variation_count - config.batch_max_images} left out)."
         )
 
-    if param in ["expand_prompt", "prompt_expansion"]:
-        parameters[param] = st.sidebar.checkbox(
-            "Prompt Expansion",
-            value=False,
-            disabled=st.session_state.running,
-        )
+    return {
+        "provider": provider,
+        "model": model,
+        "model_config": model_config,
+        "parameters": parameters,
+        "batch_size": batch_size,
+        "guidance_param": guidance_param,
+        "guidance_values": guidance_values,
+        "steps_param": steps_param,
+        "steps_values": steps_values,
+        "batch_concurrency": batch_concurrency,
+    }
 
-    if param == "prompt_upsampling":
-        parameters[param] = st.sidebar.checkbox(
-            "Prompt Upsampling",
-            value=False,
-            disabled=st.session_state.running,
-        )
 
-    if param == "image_url":
-        image_file = st.sidebar.file_uploader(
-            "Image",
-            type=["bmp", "gif", "jpg", "jpeg", "png", "webp"],
-            accept_multiple_files=False,
-            disabled=st.session_state.running,
-        )
-        if image_file:
-            parameters[param] = base64_encode_image_file(image_file)
-
-# Wrap the prompt in an accordion to display additional parameters
-for message in st.session_state.txt2img_messages:
-    role = message["role"]
-    with st.chat_message(role):
-        image_container = st.empty()
-
-        with image_container.container():
-            if role == "user":
-                with st.expander(message["content"]):
-                    # build a markdown string for additional parameters
-                    st.html("""
-                    <style>
-                        div[data-testid="stMarkdownContainer"] p:not(:last-of-type) { margin-bottom: 0 }
-                    </style>
-                    """)
-                    filtered_parameters = [
-                        f"`{k}`: {v}"
-                        for k, v in message["parameters"].items()
-                        if k not in config.hidden_parameters
-                    ]
-                    st.markdown(f"`model`: {message['model']}\n\n" + "\n\n".join(filtered_parameters))
-
-            if role == "assistant":
-                # image is full width when _not_ in full-screen mode
-                st.html("""
-                <style>
-                    div[data-testid="stImage"]:has(img[style*="max-width: 100%"]) {
-                        height: auto;
-                        max-width: 512px;
-                    }
-                    div[data-testid="stImage"] img[style*="max-width: 100%"] {
-                        border-radius: 8px;
-                    }
-                </style>
-                """)
-                st.write(message["content"])  # success will be image, error will be text
-
-# Buttons for deleting last generation or clearing all generations
-if st.session_state.txt2img_messages:
-    button_container = st.empty()
-    with button_container.container():
-        # https://discuss.streamlit.io/t/st-button-in-one-line/25966/6
+def show_earlier():
+    st.session_state.txt2img_history_turns += config.history_turns
+
+
+def delete_last():
+    if len(st.session_state.txt2img_messages) >= 2:
+        st.session_state.txt2img_messages.pop()
+        st.session_state.txt2img_messages.pop()
+
+
+def clear_all():
+    for job in session_jobs(session, "txt2img"):
+        cancel_job(job)
+    st.session_state.txt2img_messages = []
+    st.session_state.txt2img_seed = 0
+    st.session_state.txt2img_history_turns = config.history_turns
+
+
+# History reruns on its own for its buttons (their callbacks update it first), without re-running the sidebar
+@st.fragment
+def history():
+    # Only the most recent turns are rendered; older ones are loaded on request
+    hidden = max(len(st.session_state.txt2img_messages) - st.session_state.txt2img_history_turns * 2, 0)
+    if hidden:
+        st.button(f"Show earlier generations ({hidden // 2} hidden)", on_click=show_earlier)
+
+    # Styles are global, so they're added once for the whole history rather than per message
+    if st.session_state.txt2img_messages:
+        # parameters accordion and image, which is full width when _not_ in full-screen mode
         st.html("""
         <style>
-            div[data-testid="column"] {
-                width: fit-content;
-                min-width: 0;
-                flex: none;
+            div[data-testid="stMarkdownContainer"] p:not(:last-of-type) { margin-bottom: 0 }
+            div[data-testid="stImage"]:has(img[style*="max-width: 100%"]) {
+                height: auto;
+                max-width: 512px;
+            }
+            div[data-testid="stImage"] img[style*="max-width: 100%"] {
+                border-radius: 8px;
             }
         </style>
         """)
 
-        col1, col2 = st.columns(2)
-        with col1:
-            if (
-                st.button("❌", help="Delete last generation", disabled=st.session_state.running)
-                and len(st.session_state.txt2img_messages) >= 2
-            ):
-                st.session_state.txt2img_messages.pop()
-                st.session_state.txt2img_messages.pop()
-                st.rerun()
-
-        with col2:
-            if st.button("🗑️", help="Clear all generations", disabled=st.session_state.running):
-                st.session_state.txt2img_messages = []
-                st.session_state.txt2img_seed = 0
-                st.rerun()
-else:
-    button_container = None
-
-# Set running state to True and show spinner while loading.
-# Update state and refresh on response; errors will be displayed as chat messages.
-if prompt := st.chat_input(
-    "What do you want to see?",
-    on_submit=lambda: setattr(st.session_state, "running", True),
-):
-    if "seed" in parameters and parameters["seed"] >= 0:
+    # Wrap the prompt in an accordion to display additional parameters
+    for message in st.session_state.txt2img_messages[hidden:]:
+        role = message["role"]
+        with st.chat_message(role):
+            image_container = st.empty()
+
+            with image_container.container():
+                if role == "user":
+                    with st.expander(message["content"]):
+                        # build a markdown string for additional parameters
+                        filtered_parameters = [
+                            f"`{k}`: {v}"
+                            for k, v in message["parameters"].items()
+                            if k not in config.hidden_parameters
+                        ]
+                        st.markdown(f"`model`: {message['model']}\n\n" + "\n\n".join(filtered_parameters))
+
+                if role == "assistant":
+                    if isinstance(message["content"], list):
+                        render_grid(message["content"])
+                    else:
+                        render_image(message["content"])
+
+    # Buttons for deleting last generation or clearing all generations
+    if st.session_state.txt2img_messages:
+        button_container = st.empty()
+        with button_container.container():
+            # https://discuss.streamlit.io/t/st-button-in-one-line/25966/6
+            st.html("""
+            <style>
+                div[data-testid="column"] {
+                    width: fit-content;
+                    min-width: 0;
+                    flex: none;
+                }
+            </style>
+            """)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("❌", help="Delete last generation", on_click=delete_last)
+
+            with col2:
+                st.button("🗑️", help="Clear all generations", on_click=clear_all)
+
+
+# Values of the sidebar widgets
+with st.sidebar:
+    current = settings()
+
+st.html("""
+    <h1>Text to Image</h1>
+    <p>Generate an image from a text prompt.</p>
+""")
+
+history()
+
+if session_jobs(session, "txt2img"):
+    render_jobs()
+
+# Queue the generation and rerun to show it; errors will be displayed as chat messages
+if prompt := st.chat_input("What do you want to see?"):
+    provider = current["provider"]
+    model = current["model"]
+    model_config = current["model_config"]
+    parameters = current["parameters"]
+    batch_size = current["batch_size"]
+    guidance_param = current["guidance_param"]
+    guidance_values = current["guidance_values"]
+    steps_param = current["steps_param"]
+    steps_values = current["steps_values"]
+    batch_concurrency = current["batch_concurrency"]
+
+    # A pinned seed makes the request deterministic, so the result can come from the image cache
+    cache = "seed" in parameters and parameters["seed"] >= 0
+    if cache:
         st.session_state.txt2img_seed = parameters["seed"]
     else:
         st.session_state.txt2img_seed = int(datetime.now().timestamp() * 1e6) % (1 << 53)
         if "seed" in parameters:
             parameters["seed"] = st.session_state.txt2img_seed
 
-    if button_container:
-        button_container.empty()
-
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    with st.chat_message("assistant"):
-        with st.spinner("Running..."):
-            if model_config.kwargs:
-                parameters.update(model_config.kwargs)
-            session_key = f"api_key_{provider}"
-            api_key = st.session_state[session_key] or image_providers[provider].api_key
-            image = txt2img_generate(api_key, provider, model, prompt, parameters)
-        st.session_state.running = False
-
-    st.session_state.txt2img_messages.append(
-        {"role": "user", "content": prompt, "parameters": parameters, "model": model_config.name}
-    )
-    st.session_state.txt2img_messages.append({"role": "assistant", "content": image})
-    st.rerun()
+    if model_config.kwargs:
+        parameters.update(model_config.kwargs)
+
+    # Every combination of guidance, steps, and seed (seeds count up from the base seed)
+    variations = []
+    for guidance in guidance_values or [None]:
+        for steps in steps_values or [None]:
+            for i in range(batch_size):
+                variation = {**parameters}
+                if guidance is not None:
+                    variation[guidance_param] = guidance
+                if steps is not None:
+                    variation[steps_param] = steps
+                if "seed" in parameters:
+                    variation["seed"] = (st.session_state.txt2img_seed + i) % (1 << 53)
+                variations.append(variation)
+    # The sidebar warns when the grid is larger than this
+    variations = variations[: config.batch_max_images]
+
+    session_key = f"api_key_{provider}"
+    api_key = st.session_state[session_key] or image_providers[provider].api_key
+    # Keys for equivalent backends a slow or failing request can be hedged or failed over to
+    api_keys = {p: st.session_state[f"api_key_{p}"] or c.api_key for p, c in image_providers.items()}
+    message = {"role": "user", "content": prompt, "parameters": parameters, "model": model_config.name}
+
+    if len(variations) == 1:
+        captions = None
+        priority = INTERACTIVE
+
+        async def work(job):
+            if config.hedge.enabled:
+                return await txt2img_hedged_async(
+                    api_keys, provider, model, prompt, parameters, cache, job.queue
+                )
+            return await txt2img_failover_async(
+                api_keys, provider, model, prompt, parameters, cache, job.queue
+            )
+    else:
+        captions = [
+            ", ".join(
+                f"{k}: {variation[k]}" for k in ["seed", guidance_param, steps_param] if k and k in variation
+            )
+            for variation in variations
+        ]
+        priority = BATCH
+
+        # Fill in the grid as each image finishes
+        async def work(job):
+            batch = txt2img_batch_async(
+                api_key, provider, model, prompt, variations, batch_concurrency, cache
+            )
+            async with aclosing(batch):
+                async for i, result in batch:
+                    job.partial[i] = result
+            return [{"content": job.partial[i], "caption": caption} for i, caption in enumerate(captions)]
+
+    if submit_job(session, "txt2img", work, {"message": message, "captions": captions}, priority):
+        st.rerun()
+    st.warning(f"Wait for one of your {config.jobs.max_session_jobs} generations in progress to finish.")
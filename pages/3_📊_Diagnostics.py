@@ -0,0 +1,218 @@
+from datetime import datetime
+
+import streamlit as st
+
+from lib import (
+    breakers,
+    catalog_status,
+    config,
+    get_catalog,
+    image_cache,
+    job_stats,
+    limiters,
+    listings,
+    metrics_store,
+    model_available,
+    text_cache,
+)
+
+st.set_page_config(
+    page_title=f"Diagnostics - {config.title}",
+    layout=config.layout,
+)
+
+st.logo(config.logo, size="small")
+
+st.html("""
+<div style="display: flex; align-items: center; gap: 0.75rem">
+    <h1 style="padding: 0">Diagnostics</h1>
+</div>
+""")
+
+if not config.diagnostics:
+    st.info("Diagnostics are disabled (`config.diagnostics`, or set `PLAYGROUND_DIAGNOSTICS=1`).")
+    st.stop()
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+def provider_name(provider):
+    provider_config = get_catalog().providers.get(provider)
+    return provider_config.name if provider_config else provider
+
+
+# Text generation streams from every session, newest last
+st.markdown("## Text generation")
+if not config.metrics.enabled:
+    st.info("Metrics are disabled (`config.metrics.enabled`).")
+else:
+    st.caption(f"Last {config.metrics.window:,} streams across all sessions. Latencies in milliseconds.")
+
+    rows = metrics_store.summary()
+    if rows:
+        st.dataframe(
+            [
+                {
+                    "Provider": provider_name(row["provider"]),
+                    "Model": row["model"],
+                    "Requests": row["requests"],
+                    "Cached": row["cached"],
+                    "Errors": ", ".join(f"{error} ({count})" for error, count in row["errors"].items()),
+                    "TTFT p50": ms(row["ttft"][50]),
+                    "TTFT p90": ms(row["ttft"][90]),
+                    "ITL p50": ms(row["itl"][50]),
+                    "ITL p90": ms(row["itl"][90]),
+                    "ITL p99": ms(row["itl"][99]),
+                    "Duration p50": ms(row["duration"][50]),
+                    "Tokens/s": row["tokens_per_second"] and round(row["tokens_per_second"], 1),
+                }
+                for row in rows
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+    else:
+        st.caption("No streams recorded yet.")
+
+    samples = metrics_store.samples()
+    if samples:
+        with st.expander("Recent streams"):
+            st.dataframe(
+                [
+                    {
+                        "Started": datetime.fromtimestamp(s.started_at).strftime("%H:%M:%S"),
+                        "Provider": s.provider,
+                        "Model": s.model,
+                        "TTFT": ms(s.ttft),
+                        "Duration": ms(s.duration),
+                        "Tokens": s.tokens,
+                        "Tokens/s": None if s.tokens_per_second is None else round(s.tokens_per_second, 1),
+                        "Cached": s.cached,
+                        "Error": s.error,
+                    }
+                    for s in reversed(samples[-100:])
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+        # Exports
+        col1, col2, _ = st.columns([1, 1, 4])
+        col1.download_button(
+            "Prometheus",
+            metrics_store.prometheus(),
+            file_name="metrics.prom",
+            mime="text/plain",
+            use_container_width=True,
+        )
+        col2.download_button(
+            "JSONL",
+            metrics_store.jsonl(),
+            file_name="metrics.jsonl",
+            mime="application/x-ndjson",
+            use_container_width=True,
+        )
+
+    if config.metrics.log_path:
+        st.caption(f"Streams are also logged to `{config.metrics.log_path}`.")
+
+# Shared caches
+st.markdown("## Caches")
+st.dataframe(
+    [{"Cache": name, **cache.stats} for name, cache in [("Images", image_cache), ("Text", text_cache)]],
+    hide_index=True,
+    use_container_width=True,
+)
+
+# Model catalog currently in use
+status = catalog_status()
+st.markdown("## Catalog")
+st.caption(
+    f"{status['models']} models from {status['providers']} providers in `{status['path']}`, loaded "
+    f"{datetime.fromtimestamp(status['loaded_at']).strftime('%H:%M:%S')}."
+)
+if status["error"]:
+    st.error(f"Still using the previous catalog, the changed file couldn't be loaded: {status['error']}")
+
+# What providers last said about the catalog's models; models they no longer list are hidden from the pages
+provider_listings = listings()
+if provider_listings:
+    st.markdown("## Model discovery")
+    st.caption(f"Listings are refreshed every {config.discovery.ttl / 60:.0f} minutes in the background.")
+    current = get_catalog()
+    st.dataframe(
+        [
+            {
+                "Provider": provider_name(provider),
+                "Listed": None if listing.models is None else len(listing.models),
+                "Hidden": ", ".join(
+                    sorted(
+                        {
+                            model
+                            for kind, model_provider, model in current.models
+                            if model_provider == provider and model_available(provider, model) is False
+                        }
+                    )
+                ),
+                "Updated": (
+                    datetime.fromtimestamp(listing.fetched_at).strftime("%H:%M:%S")
+                    if listing.fetched_at
+                    else None
+                ),
+                "Error": listing.error,
+            }
+            for provider, listing in sorted(provider_listings.items())
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+# Background generation jobs from every session
+st.markdown("## Jobs")
+st.dataframe([{k.capitalize(): v for k, v in job_stats().items()}], hide_index=True, use_container_width=True)
+
+# Circuit breakers of providers that have had requests since startup
+states = breakers()
+if states:
+    st.markdown("## Providers")
+    st.dataframe(
+        [
+            {
+                "Provider": provider_name(provider),
+                "State": breaker.state,
+                "Consecutive failures": breaker.failures,
+            }
+            for provider, breaker in sorted(states.items())
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+
+# Rate limit queues of models that have had requests since startup
+queues = limiters()
+if queues:
+    st.markdown("## Queues")
+    st.dataframe(
+        [
+            {
+                "Provider": provider_name(provider),
+                "Model": model,
+                "In flight": limiter.in_flight,
+                "Waiting": limiter.queued,
+                "Limit": ", ".join(
+                    f"{value} {name}"
+                    for name, value in [
+                        ("RPM", limiter.settings.rpm),
+                        ("TPM", limiter.settings.tpm),
+                        ("in flight", limiter.settings.concurrency),
+                    ]
+                    if value
+                ),
+            }
+            for (provider, model), limiter in sorted(queues.items())
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
@@ -0,0 +1,39 @@
+import asyncio
+from io import BytesIO
+
+import httpx
+import pytest
+from PIL import Image
+
+from lib.api import read_image
+
+
+def png():
+    output = BytesIO()
+    Image.new("RGB", (256, 256), "blue").save(output, format="PNG")
+    return output.getvalue()
+
+
+class Stream(httpx.AsyncByteStream):
+    def __init__(self, data, chunk_size):
+        self.chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def response(data, chunk_size=1000):
+    return httpx.Response(200, stream=Stream(data, chunk_size))
+
+
+def test_read_image_returns_the_whole_body():
+    data = png()
+    assert asyncio.run(read_image(response(data, chunk_size=5))) == data
+
+
+def test_read_image_rejects_other_content():
+    with pytest.raises(ValueError, match="not an image"):
+        asyncio.run(read_image(response(b"<html>rate limited</html>")))
+    with pytest.raises(ValueError, match="not an image"):
+        asyncio.run(read_image(response(b"GIF")))
@@ -0,0 +1,62 @@
+import pytest
+
+from lib.config import TextModelConfig, config
+from lib.context import estimate_message_tokens, fit_context
+
+MAX_TOKENS = 100
+
+
+def chat(turns):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} ".ljust(400, ".")})
+        messages.append({"role": "assistant", "content": f"answer {turn} ".ljust(400, ".")})
+    return messages + [{"role": "user", "content": "now"}]
+
+
+def model(budget):
+    return TextModelConfig(name="Test", parameters=(), context_window=budget + MAX_TOKENS)
+
+
+# Prior turns that fit the budget when the history is trimmed as finely as possible
+def max_fit(messages, budget):
+    for turns in range(len(messages) // 2, -1, -1):
+        kept = messages[len(messages) - 1 - 2 * turns :]
+        if sum(estimate_message_tokens(m) for m in kept) <= budget:
+            return turns
+    return 0
+
+
+@pytest.mark.parametrize("fitting", [3, 7, 30])
+@pytest.mark.parametrize("turns", [8, 16, 24, 40])
+def test_keeps_history_within_one_chunk_of_what_fits(turns, fitting):
+    messages = chat(turns)
+    turn_tokens = estimate_message_tokens(messages[0]) + estimate_message_tokens(messages[1])
+    budget = fitting * turn_tokens + estimate_message_tokens(messages[-1]) + 10
+    kept, report = fit_context(messages, model(budget), MAX_TOKENS)
+
+    best = max_fit(messages, budget)
+    kept_turns = (len(kept) - 1) // 2
+    assert kept[0]["role"] == "user" and kept[-1] == messages[-1]
+    assert report.tokens <= budget
+    assert best - kept_turns < config.context_trim_turns
+    assert kept_turns * 2 >= best
+
+
+def test_cut_stays_put_across_turns():
+    messages = chat(40)
+    turn_tokens = estimate_message_tokens(messages[0]) + estimate_message_tokens(messages[1])
+    budget = 30 * turn_tokens + 10
+    starts = []
+    for turns in range(31, 41):
+        kept, _ = fit_context(chat(turns), model(budget), MAX_TOKENS)
+        starts.append(kept[0]["content"])
+    # The oldest kept message changes once every `context_trim_turns` turns at most
+    changes = len(set(starts)) - 1
+    assert changes <= -(-len(starts) // config.context_trim_turns)
+
+
+def test_under_budget_is_untouched():
+    messages = chat(2)
+    kept, report = fit_context(messages, model(10_000), MAX_TOKENS)
+    assert kept == messages and report.dropped_messages == 0
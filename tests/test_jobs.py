@@ -0,0 +1,37 @@
+import pytest
+
+from lib import jobs
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    monkeypatch.setattr(jobs, "_jobs", {})
+    job = jobs.Job(
+        id="job", session="token", tab="owner", kind="txt2img", priority=jobs.INTERACTIVE, work=None
+    )
+    jobs._jobs["token"] = {job.id: job}
+    return job
+
+
+def test_copied_link_gets_nothing_while_the_owner_is_connected(stored, monkeypatch):
+    monkeypatch.setattr(jobs, "_connected", lambda tab: tab == "owner")
+    session = jobs._claim("token")
+    assert session != "token"
+    assert jobs.session_jobs(session) == []
+    assert jobs.session_jobs("token") == [stored]
+
+
+def test_claim_moves_jobs_to_a_new_token_once(stored, monkeypatch):
+    monkeypatch.setattr(jobs, "_connected", lambda tab: False)
+    session = jobs._claim("token")
+    assert session != "token"
+    assert jobs.session_jobs(session) == [stored]
+    assert stored.session == session
+    # The old token is spent
+    assert jobs.session_jobs(jobs._claim("token")) == []
+
+
+def test_unknown_token_gets_a_fresh_one(stored):
+    session = jobs._claim("guess")
+    assert session not in ["guess", "token"]
+    assert jobs.session_jobs(session) == []
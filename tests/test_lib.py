@@ -0,0 +1,12 @@
+import lib
+
+
+def test_all_matches_the_lazy_exports():
+    assert set(lib.__all__) == {*lib._exports, "config"}
+    assert len(lib.__all__) == len(set(lib.__all__))
+
+
+def test_exports_resolve():
+    for name in lib.__all__:
+        assert getattr(lib, name) is not None
+    assert set(lib.__all__) <= set(dir(lib))
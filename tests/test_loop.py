@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from lib.loop import iterate
+
+
+class Stopped(Exception):
+    pass
+
+
+def test_stopping_mid_stream_keeps_the_original_exception():
+    cleaned_up = []
+
+    async def stream():
+        try:
+            yield 1
+            await asyncio.sleep(10)
+            yield 2
+        finally:
+            # Async cleanup still running when the script thread closes the generator
+            await asyncio.sleep(0.1)
+            cleaned_up.append(True)
+
+    calls = 0
+
+    def progress():
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise Stopped
+
+    items = []
+    with pytest.raises(Stopped):
+        for item in iterate(stream(), progress):
+            items.append(item)
+    assert items == [1]
+    assert cleaned_up == [True]
+
+
+def test_iterate_closes_the_generator_when_abandoned():
+    closed = []
+
+    async def stream():
+        try:
+            for i in range(10):
+                yield i
+        finally:
+            closed.append(True)
+
+    for item in iterate(stream()):
+        if item == 2:
+            break
+    assert closed == [True]
@@ -0,0 +1,62 @@
+from base64 import b64encode
+from io import BytesIO
+
+from PIL import Image
+
+from lib.util import Base64DataURLDecoder, downscale_image
+
+
+def jpeg(image, **kwargs):
+    output = BytesIO()
+    image.save(output, format="JPEG", **kwargs)
+    return output.getvalue()
+
+
+def test_downscale_applies_exif_orientation():
+    # Stored sideways, as phone cameras do: left half red, right half blue, rotated 90° clockwise on display
+    image = Image.new("RGB", (800, 400), "blue")
+    image.paste("red", (0, 0, 400, 400))
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    data, mime_type = downscale_image(jpeg(image, exif=exif), (100, 200))
+
+    output = Image.open(BytesIO(data))
+    assert mime_type == "image/jpeg"
+    assert output.size == (100, 200)
+    assert output.getexif().get(0x0112) is None
+    red, _, blue = output.getpixel((50, 20))
+    assert red > 200 and blue < 50
+    red, _, blue = output.getpixel((50, 180))
+    assert red < 50 and blue > 200
+
+
+def test_downscale_covers_and_crops_to_target_size():
+    data, _ = downscale_image(jpeg(Image.new("RGB", (1600, 400))), (200, 200))
+    assert Image.open(BytesIO(data)).size == (200, 200)
+
+    data, _ = downscale_image(jpeg(Image.new("RGB", (600, 900))), (400, 300))
+    assert Image.open(BytesIO(data)).size == (400, 300)
+
+
+def test_downscale_keeps_images_that_would_need_upscaling():
+    original = jpeg(Image.new("RGB", (300, 1200)))
+    assert downscale_image(original, (512, 512)) == (original, None)
+
+
+def test_data_url_decoder_across_chunks():
+    image = BytesIO()
+    Image.new("RGB", (64, 64), "red").save(image, format="PNG")
+    body = b'{"images": [{"url": "data:image\\/png;base64,' + b64encode(image.getvalue()) + b'"}]}'
+
+    decoder = Base64DataURLDecoder()
+    for i in range(0, len(body), 7):
+        decoder.feed(body[i : i + 7])
+    assert decoder.mime_type == "image/png"
+    assert decoder.close() == image.getvalue()
+
+
+def test_data_url_decoder_keeps_other_bodies():
+    decoder = Base64DataURLDecoder()
+    decoder.feed(b'{"detail": "bad request"}')
+    assert decoder.close() is None
+    assert decoder.text == '{"detail": "bad request"}'